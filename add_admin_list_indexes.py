@@ -0,0 +1,42 @@
+"""
+Migration script for the paginated admin user and shared link lists.
+Fills NULL sort columns with their defaults (keyset pagination skips NULLs),
+creates the (sort column, id) indexes and, on PostgreSQL, the email indexes
+used by the admin email search: a pattern index for prefix search and, when
+the pg_trgm extension is available, a trigram index for ADMIN_EMAIL_SEARCH=contains.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime
+from sqlalchemy import text
+from app.app import app, db, User, SharedComparison
+
+with app.app_context():
+    User.query.filter(User.subscription_status.is_(None)).update({User.subscription_status: 'free'}, synchronize_session=False)
+    User.query.filter(User.created_at.is_(None)).update({User.created_at: datetime.utcnow()}, synchronize_session=False)
+    SharedComparison.query.filter(SharedComparison.view_count.is_(None)).update({SharedComparison.view_count: 0}, synchronize_session=False)
+    SharedComparison.query.filter(SharedComparison.is_active.is_(None)).update({SharedComparison.is_active: True}, synchronize_session=False)
+    SharedComparison.query.filter(SharedComparison.created_at.is_(None)).update({SharedComparison.created_at: datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    print("✓ Filled empty sort columns")
+    
+    for table in (User.__table__, SharedComparison.__table__):
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    print("✓ Created admin list indexes")
+    
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as conn:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_email_pattern ON users (email varchar_pattern_ops)"))
+        print("✓ Created email prefix search index")
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING gin (email gin_trgm_ops)"))
+            print("✓ Created email trigram index (set ADMIN_EMAIL_SEARCH=contains to use it)")
+        except Exception as e:
+            print(f"pg_trgm not available, keeping prefix email search: {e}")
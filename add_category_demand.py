@@ -0,0 +1,15 @@
+"""
+Migration script to add the category_demand table (daily find_products
+request counts per leaf category, used by the warm-up worker).
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.app import app, db, CategoryDemand
+
+with app.app_context():
+    CategoryDemand.__table__.create(db.engine, checkfirst=True)
+    print("✓ Created category_demand table successfully!")
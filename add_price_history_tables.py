@@ -0,0 +1,16 @@
+"""
+Migration script to add the local price history store
+(price_points and price_history_sync tables).
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.app import app, db, PricePoint, PriceHistorySync
+
+with app.app_context():
+    PricePoint.__table__.create(db.engine, checkfirst=True)
+    PriceHistorySync.__table__.create(db.engine, checkfirst=True)
+    print("✓ Created price_points and price_history_sync tables successfully!")
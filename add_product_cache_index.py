@@ -0,0 +1,16 @@
+"""
+Migration script to add the created_at index on product_data_cache.
+The background janitor and get_product_data filter on created_at.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.app import app, db, ProductDataCache
+
+with app.app_context():
+    for index in ProductDataCache.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+        print(f"✓ Index {index.name} is in place")
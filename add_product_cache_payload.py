@@ -0,0 +1,19 @@
+"""
+Migration script for the compact ProductDataCache encoding.
+Adds the `payload` column and makes the legacy `data` column nullable.
+
+product_data_cache only holds short-lived comparison data (expires after an hour),
+so the table is simply recreated instead of altered in place.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.app import app, db, ProductDataCache
+
+with app.app_context():
+    ProductDataCache.__table__.drop(db.engine, checkfirst=True)
+    ProductDataCache.__table__.create(db.engine)
+    print("✓ Recreated product_data_cache table with compact payload column!")
@@ -0,0 +1,15 @@
+"""
+Migration script to add the product_listing_cache table.
+Only needed when the persistent listing cache tier is enabled (PRODUCT_CACHE_PERSIST=true).
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.app import app, db, ProductListingCache
+
+with app.app_context():
+    ProductListingCache.__table__.create(db.engine, checkfirst=True)
+    print("✓ Created product_listing_cache table successfully!")
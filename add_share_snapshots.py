@@ -0,0 +1,54 @@
+"""
+Migration script for content-addressed shared comparisons.
+Creates the comparison_snapshots and product_records tables, adds
+shared_comparisons.snapshot_hash and makes the legacy comparison_data column
+nullable. With --backfill, existing links are moved into snapshots too.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect, text
+from app.app import app, db, SharedComparison, ComparisonSnapshot, ProductRecord, store_comparison_snapshot
+
+LEGACY_COLUMNS = 'id, user_id, token, comparison_data, created_at, view_count, is_active'
+
+with app.app_context():
+    ComparisonSnapshot.__table__.create(db.engine, checkfirst=True)
+    ProductRecord.__table__.create(db.engine, checkfirst=True)
+    print("✓ Created comparison_snapshots and product_records tables")
+    
+    inspector = inspect(db.engine)
+    columns = {col['name']: col for col in inspector.get_columns('shared_comparisons')}
+    with db.engine.begin() as conn:
+        if db.engine.dialect.name == 'sqlite':
+            # SQLite cannot alter column constraints; rebuild the table instead
+            if 'snapshot_hash' not in columns or not columns['comparison_data']['nullable']:
+                indexes = inspector.get_indexes('shared_comparisons')
+                conn.execute(text("ALTER TABLE shared_comparisons RENAME TO shared_comparisons_old"))
+                for index in indexes:
+                    conn.execute(text(f"DROP INDEX IF EXISTS {index['name']}"))
+                SharedComparison.__table__.create(conn)
+                conn.execute(text(f"INSERT INTO shared_comparisons ({LEGACY_COLUMNS}) "
+                                  f"SELECT {LEGACY_COLUMNS} FROM shared_comparisons_old"))
+                conn.execute(text("DROP TABLE shared_comparisons_old"))
+                print("✓ Rebuilt shared_comparisons with snapshot_hash column")
+        else:
+            if 'snapshot_hash' not in columns:
+                conn.execute(text("ALTER TABLE shared_comparisons ADD COLUMN snapshot_hash VARCHAR(64) REFERENCES comparison_snapshots(hash)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_shared_comparisons_snapshot_hash ON shared_comparisons (snapshot_hash)"))
+                print("✓ Added snapshot_hash column")
+            conn.execute(text("ALTER TABLE shared_comparisons ALTER COLUMN comparison_data DROP NOT NULL"))
+            print("✓ comparison_data is now nullable")
+    
+    if '--backfill' in sys.argv:
+        moved = 0
+        for link in SharedComparison.query.filter(SharedComparison.snapshot_hash.is_(None),
+                                                  SharedComparison.comparison_data.isnot(None)).all():
+            link.snapshot_hash = store_comparison_snapshot(link.comparison_data)
+            link.comparison_data = None
+            db.session.commit()
+            moved += 1
+        print(f"✓ Moved {moved} shared comparisons into snapshots")
@@ -1,20 +1,37 @@
 import os
 import csv
+import atexit
+import calendar
+import math
 import json
 import time
-from collections import defaultdict, deque
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+import asyncio
+import base64
+import gzip
+import hashlib
+import itertools
+import queue
+import sqlite3
+import threading
+import unicodedata
+import warnings
+import zlib
+from collections import OrderedDict, defaultdict
+from typing import List, Dict, Any, Optional, Set, Tuple
+from datetime import datetime, timezone
 from functools import wraps
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, abort
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for, flash, abort, stream_with_context
 from dotenv import load_dotenv
 import secrets
-import requests
+import httpx
+import numpy as np
 from PIL import Image
 import pytesseract
 import io
 from openai import OpenAI
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_migrate import Migrate
@@ -70,6 +87,10 @@ login_manager.login_message = None  # Don't show flash message on redirect
 # ============================
 # Database Models
 # ============================
+# Free-tier daily allowances per action
+FREE_DAILY_LIMITS = {'explore': 3, 'compare': 1}
+
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     
@@ -93,6 +114,12 @@ class User(UserMixin, db.Model):
     # Relationships
     saved_searches = db.relationship('SavedSearch', backref='user', lazy=True, cascade='all, delete-orphan')
     
+    # Keyset pagination in the admin user list (sort column, then id)
+    __table_args__ = (
+        db.Index('ix_users_created_at_id', 'created_at', 'id'),
+        db.Index('ix_users_subscription_status_id', 'subscription_status', 'id'),
+    )
+    
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
     
@@ -111,87 +138,62 @@ class User(UserMixin, db.Model):
             return True
         return False
     
-    def can_explore(self):
-        """Check if user can perform an explore (free users: 3 per day, premium: unlimited)"""
+    def consume_daily_quota(self, kind: str) -> bool:
+        """
+        Check and count one free-tier action ('explore' or 'compare') in a single
+        conditional UPDATE: the counter restarts on a new day and only increments
+        while under the limit, so concurrent requests cannot race past it.
+        Subscribers are unlimited and cause no write.
+        """
         if self.is_subscribed():
             return True
         
+        limit = FREE_DAILY_LIMITS[kind]
+        count_col = getattr(User, f'{kind}_count')
+        date_col = getattr(User, f'last_{kind}_date')
         today = datetime.utcnow().date()
-        
-        # Reset count if it's a new day
-        if self.last_explore_date != today:
-            self.explore_count = 0
-            self.last_explore_date = today
-            db.session.commit()
-        
-        return self.explore_count < 3
-    
-    def increment_explore_count(self):
-        """Increment the explore count for free users"""
-        if not self.is_subscribed():
-            today = datetime.utcnow().date()
-            
-            # Reset count if it's a new day
-            if self.last_explore_date != today:
-                self.explore_count = 0
-                self.last_explore_date = today
-            
-            self.explore_count += 1
+        new_day = db.or_(date_col.is_(None), date_col != today)
+        used = db.func.coalesce(count_col, 0)
+        
+        result = db.session.execute(
+            db.update(User)
+            .where(User.id == self.id, db.or_(new_day, used < limit))
+            .values({count_col: db.case((new_day, 1), else_=used + 1), date_col: today})
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
             db.session.commit()
+            invalidate_user_cache(self.id)
+            return True
+        db.session.rollback()
+        return False
     
-    def get_remaining_explores(self):
-        """Get remaining explores for today (free users only)"""
+    def _remaining_today(self, kind: str) -> float:
         if self.is_subscribed():
             return float('inf')  # Unlimited
         
-        today = datetime.utcnow().date()
-        
-        # Reset count if it's a new day
-        if self.last_explore_date != today:
-            return 3
+        limit = FREE_DAILY_LIMITS[kind]
+        # A count from an earlier day no longer applies
+        if getattr(self, f'last_{kind}_date') != datetime.utcnow().date():
+            return limit
         
-        return max(0, 3 - self.explore_count)
+        return max(0, limit - (getattr(self, f'{kind}_count') or 0))
+    
+    def can_explore(self):
+        """Check if user can perform an explore (free users: 3 per day, premium: unlimited)"""
+        return self.get_remaining_explores() > 0
+    
+    def get_remaining_explores(self):
+        """Get remaining explores for today (free users only)"""
+        return self._remaining_today('explore')
     
     def can_compare(self):
         """Check if user can perform a compare (free users: 1 per day, premium: unlimited)"""
-        if self.is_subscribed():
-            return True
-        
-        today = datetime.utcnow().date()
-        
-        # Reset count if it's a new day
-        if self.last_compare_date != today:
-            self.compare_count = 0
-            self.last_compare_date = today
-            db.session.commit()
-        
-        return self.compare_count < 1
-    
-    def increment_compare_count(self):
-        """Increment the compare count for free users"""
-        if not self.is_subscribed():
-            today = datetime.utcnow().date()
-            
-            # Reset count if it's a new day
-            if self.last_compare_date != today:
-                self.compare_count = 0
-                self.last_compare_date = today
-            
-            self.compare_count += 1
-            db.session.commit()
+        return self.get_remaining_compares() > 0
     
     def get_remaining_compares(self):
         """Get remaining compares for today (free users only)"""
-        if self.is_subscribed():
-            return float('inf')  # Unlimited
-        
-        today = datetime.utcnow().date()
-        
-        # Reset count if it's a new day
-        if self.last_compare_date != today:
-            return 1
-        
-        return max(0, 1 - self.compare_count)
+        return self._remaining_today('compare')
     
     def __repr__(self):
         return f'<User {self.email}>'
@@ -219,18 +221,63 @@ class SharedComparison(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     token = db.Column(db.String(32), unique=True, nullable=False, index=True)
-    comparison_data = db.Column(db.JSON, nullable=False)  # Store full comparison data
+    comparison_data = db.Column(db.JSON, nullable=True)  # Legacy rows: full comparison data
+    snapshot_hash = db.Column(db.String(64), db.ForeignKey('comparison_snapshots.hash'), nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     view_count = db.Column(db.Integer, default=0)
     is_active = db.Column(db.Boolean, default=True)
     
     # Relationships
     user = db.relationship('User', backref='shared_comparisons')
+    snapshot = db.relationship('ComparisonSnapshot', lazy='joined')
+    
+    # Keyset pagination in the admin shared links list (sort column, then id)
+    __table_args__ = (
+        db.Index('ix_shared_comparisons_created_at_id', 'created_at', 'id'),
+        db.Index('ix_shared_comparisons_view_count_id', 'view_count', 'id'),
+        db.Index('ix_shared_comparisons_is_active_id', 'is_active', 'id'),
+    )
+    
+    @property
+    def product_count(self):
+        if self.snapshot is not None:
+            return self.snapshot.product_count
+        return len((self.comparison_data or {}).get('products') or [])
+    
+    def get_comparison_data(self):
+        if self.snapshot_hash is not None:
+            return load_comparison_snapshot(self.snapshot_hash)
+        return self.comparison_data
     
     def __repr__(self):
         return f'<SharedComparison {self.token}>'
 
 
+class ComparisonSnapshot(db.Model):
+    """Shared comparison content, stored once per distinct content hash (see store_comparison_snapshot)"""
+    __tablename__ = 'comparison_snapshots'
+    
+    hash = db.Column(db.String(64), primary_key=True)
+    payload = db.deferred(db.Column(db.LargeBinary, nullable=False))  # zlib JSON, products as ProductRecord hashes
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ComparisonSnapshot {self.hash[:12]}>'
+
+
+class ProductRecord(db.Model):
+    """A single product as it appeared in a shared comparison, stored once per content hash"""
+    __tablename__ = 'product_records'
+    
+    hash = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)  # zlib JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ProductRecord {self.hash[:12]}>'
+
+
 class ProductDataCache(db.Model):
     """Temporary storage for product comparison data (works across Railway instances)"""
     __tablename__ = 'product_data_cache'
@@ -238,16 +285,100 @@ class ProductDataCache(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     cache_key = db.Column(db.String(32), unique=True, nullable=False, index=True)
-    data = db.Column(db.JSON, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    data = db.Column(db.JSON, nullable=True)  # Legacy rows: plain JSON document
+    payload = db.Column(db.LargeBinary, nullable=True)  # Compact encoding, see encode_product_payload
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def set_data(self, matrix):
+        self.payload = encode_product_payload(matrix)
+        self.data = None
+    
+    def get_data(self):
+        if self.payload is not None:
+            return decode_product_payload(self.payload)
+        return self.data
     
     def __repr__(self):
         return f'<ProductDataCache {self.cache_key}>'
 
 
-@login_manager.user_loader
-def load_user(user_id):
-    return db.session.get(User, int(user_id))
+class ProductListingCache(db.Model):
+    """Persistent tier of the Kassal product listing cache, one row per (category, page)"""
+    __tablename__ = 'product_listing_cache'
+    
+    category_id = db.Column(db.String(20), primary_key=True)
+    page = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.JSON, nullable=False)
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<ProductListingCache {self.category_id}:{self.page}>'
+
+
+class CategoryDemand(db.Model):
+    """How often each leaf category was requested through find_products per day (drives cache warm-up)"""
+    __tablename__ = 'category_demand'
+    
+    category_id = db.Column(db.String(20), primary_key=True)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    request_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<CategoryDemand {self.category_id} {self.day}: {self.request_count}>'
+
+
+class PricePoint(db.Model):
+    """Normalized price history: one price per (product, store, date)"""
+    __tablename__ = 'price_points'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.String(32), nullable=False)
+    store = db.Column(db.String(120), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'store', 'date', name='uq_price_points_product_store_date'),
+        db.Index('ix_price_points_product_date', 'product_id', 'date'),
+    )
+    
+    def __repr__(self):
+        return f'<PricePoint {self.product_id} {self.store} {self.date}: {self.price}>'
+
+
+class PriceHistorySync(db.Model):
+    """Per-product bookkeeping for incremental price history refreshes"""
+    __tablename__ = 'price_history_sync'
+    
+    product_id = db.Column(db.String(32), primary_key=True)
+    latest_date = db.Column(db.Date, nullable=True)  # newest stored PricePoint date
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<PriceHistorySync {self.product_id} {self.latest_date}>'
+
+
+class Category(db.Model):
+    """Product category taxonomy (seeded from static/categories.csv)"""
+    __tablename__ = 'categories'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    parent_id = db.Column(db.Integer, nullable=True, index=True)
+    name = db.Column(db.String(200), nullable=False)
+    is_active = db.Column(db.Boolean, default=True, nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+    
+    def to_dict(self):
+        return {
+            'id': str(self.id),
+            'parent_id': str(self.parent_id) if self.parent_id is not None else None,
+            'name': self.name,
+            'is_active': bool(self.is_active),
+        }
+    
+    def __repr__(self):
+        return f'<Category {self.id} {self.name}>'
+
 
 # ============================
 # Authentication Routes
@@ -635,41 +766,137 @@ def admin_required(f):
     return decorated_function
 
 
+ADMIN_STATS_TTL = int(os.environ.get('ADMIN_STATS_TTL', '60'))
+_admin_stats: Optional[tuple] = None  # (stats, computed_at)
+
+
+def compute_admin_stats() -> Dict[str, Any]:
+    """
+    Everything the admin dashboard shows: all counters in one statement of
+    scalar subqueries, plus the recent signups and most viewed links. Rows are
+    returned as plain dicts so the result can be cached across requests.
+    """
+    def scalar(*columns, where=None):
+        stmt = db.select(*columns)
+        if where is not None:
+            stmt = stmt.where(where)
+        return stmt.scalar_subquery()
+    
+    counts = db.session.execute(db.select(
+        scalar(db.func.count(User.id)).label('total_users'),
+        scalar(db.func.count(User.id), where=User.subscription_status == 'active').label('premium_users'),
+        scalar(db.func.count(SavedSearch.id)).label('total_searches'),
+        scalar(db.func.count(SharedComparison.id)).label('total_shared_links'),
+        scalar(db.func.count(SharedComparison.id), where=SharedComparison.is_active.is_(True)).label('active_shared_links'),
+        scalar(db.func.coalesce(db.func.sum(SharedComparison.view_count), 0)).label('total_views'),
+    )).one()
+    
+    recent_users = [
+        {'email': email, 'created_at': created_at, 'subscription_status': status}
+        for email, created_at, status in db.session.query(User.email, User.created_at, User.subscription_status)
+        .order_by(User.created_at.desc(), User.id.desc()).limit(10)
+    ]
+    popular_shared = [
+        {'user': {'email': email}, 'view_count': view_count, 'created_at': created_at, 'token': token}
+        for email, view_count, created_at, token in db.session.query(
+            User.email, SharedComparison.view_count, SharedComparison.created_at, SharedComparison.token)
+        .join(User, SharedComparison.user_id == User.id)
+        .order_by(SharedComparison.view_count.desc(), SharedComparison.id.desc()).limit(5)
+    ]
+    
+    stats = dict(counts._mapping)
+    stats['free_users'] = stats['total_users'] - stats['premium_users']
+    stats['recent_users'] = recent_users
+    stats['popular_shared'] = popular_shared
+    return stats
+
+
+def get_admin_stats() -> Dict[str, Any]:
+    """compute_admin_stats(), reused for ADMIN_STATS_TTL seconds."""
+    global _admin_stats
+    if _admin_stats is not None and time.time() - _admin_stats[1] < ADMIN_STATS_TTL:
+        return _admin_stats[0]
+    stats = compute_admin_stats()
+    _admin_stats = (stats, time.time())
+    return stats
+
+
 @app.route('/admin')
 @login_required
 @admin_required
 def admin_dashboard():
     """Display admin dashboard with statistics."""
-    # Get user statistics
-    total_users = User.query.count()
-    premium_users = User.query.filter_by(subscription_status='active').count()
-    free_users = total_users - premium_users
-    
-    # Get recent signups (last 10)
-    recent_users = User.query.order_by(User.created_at.desc()).limit(10).all()
-    
-    # Get saved searches count
-    total_searches = SavedSearch.query.count()
-    
-    # Get shared links statistics
-    total_shared_links = SharedComparison.query.count()
-    active_shared_links = SharedComparison.query.filter_by(is_active=True).count()
-    total_views = db.session.query(db.func.sum(SharedComparison.view_count)).scalar() or 0
+    return render_template('admin.html', **get_admin_stats())
+
+
+ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE', '50'))
+# 'prefix' uses the email b-tree index; 'contains' needs the pg_trgm index (see add_admin_list_indexes.py)
+ADMIN_EMAIL_SEARCH = os.environ.get('ADMIN_EMAIL_SEARCH', 'prefix')
+
+
+def encode_cursor(value, row_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, column) -> Optional[tuple]:
+    """(sort value, id) from encode_cursor, or None if the cursor is malformed."""
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if value is not None and isinstance(column.type, db.DateTime):
+            value = datetime.fromisoformat(value)
+        return value, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_page(query, column, id_column, descending: bool, after: Optional[str], page_size: int = ADMIN_PAGE_SIZE):
+    """
+    One page of `query` ordered by (column, id), starting after the `after`
+    cursor. Seeks through the (column, id) index instead of OFFSET, so every
+    page costs the same. Returns (rows, next_cursor or None).
+    """
+    if after:
+        position = decode_cursor(after, column)
+        if position is not None:
+            value, row_id = position
+            if descending:
+                query = query.filter(db.or_(column < value, db.and_(column == value, id_column < row_id)))
+            else:
+                query = query.filter(db.or_(column > value, db.and_(column == value, id_column > row_id)))
     
-    # Get most viewed shared comparisons
-    popular_shared = SharedComparison.query.order_by(SharedComparison.view_count.desc()).limit(5).all()
+    if descending:
+        query = query.order_by(column.desc(), id_column.desc())
+    else:
+        query = query.order_by(column.asc(), id_column.asc())
     
-    return render_template('admin.html',
-        total_users=total_users,
-        premium_users=premium_users,
-        free_users=free_users,
-        recent_users=recent_users,
-        total_searches=total_searches,
-        total_shared_links=total_shared_links,
-        active_shared_links=active_shared_links,
-        total_views=total_views,
-        popular_shared=popular_shared
-    )
+    rows = query.limit(page_size + 1).all()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, column.key), last.id)
+    return rows, next_cursor
+
+
+_admin_list_counts: Dict[tuple, tuple] = {}  # (list, search) -> (count, counted_at)
+
+
+def admin_list_count(key: tuple, query, first_page: bool) -> int:
+    """
+    Total rows of an admin list. Counting is a full scan, so it runs on the
+    first page and is reused by the following pages for ADMIN_STATS_TTL seconds.
+    """
+    cached = _admin_list_counts.get(key)
+    if not first_page and cached is not None and time.time() - cached[1] < ADMIN_STATS_TTL:
+        return cached[0]
+    if len(_admin_list_counts) >= 256:
+        _admin_list_counts.clear()
+    count = query.count()
+    _admin_list_counts[key] = (count, time.time())
+    return count
 
 
 @app.route('/admin/users')
@@ -677,29 +904,37 @@ def admin_dashboard():
 @admin_required
 def admin_users():
     """Display user management page."""
-    # Get all users with ordering
+    # Get one page of users with ordering
     sort_by = request.args.get('sort', 'created_at')
     order = request.args.get('order', 'desc')
-    search = request.args.get('search', '')
+    search = request.args.get('search', '').strip().lower()
+    after = request.args.get('after')
     
     query = User.query
     
-    # Apply search filter
+    # Apply search filter (emails are stored lowercased)
     if search:
-        query = query.filter(User.email.ilike(f'%{search}%'))
+        if ADMIN_EMAIL_SEARCH == 'contains':
+            query = query.filter(User.email.contains(search, autoescape=True))
+        else:
+            query = query.filter(User.email.startswith(search, autoescape=True))
     
-    # Apply sorting
-    if sort_by == 'email':
-        query = query.order_by(User.email.desc() if order == 'desc' else User.email.asc())
-    elif sort_by == 'subscription_status':
-        query = query.order_by(User.subscription_status.desc() if order == 'desc' else User.subscription_status.asc())
-    else:  # created_at
-        query = query.order_by(User.created_at.desc() if order == 'desc' else User.created_at.asc())
+    total_users = admin_list_count(('users', search), query, first_page=not after)
     
-    users = query.all()
+    # Apply sorting
+    sort_columns = {
+        'email': User.email,
+        'subscription_status': User.subscription_status,
+        'created_at': User.created_at,
+    }
+    column = sort_columns.get(sort_by, User.created_at)
+    users, next_cursor = keyset_page(query, column, User.id, order == 'desc', after)
     
     return render_template('admin_users.html',
         users=users,
+        total_users=total_users,
+        next_cursor=next_cursor,
+        after=after,
         sort_by=sort_by,
         order=order,
         search=search
@@ -732,21 +967,25 @@ def admin_shared_links():
     """Display shared links management page."""
     sort_by = request.args.get('sort', 'created_at')
     order = request.args.get('order', 'desc')
+    after = request.args.get('after')
     
-    query = SharedComparison.query
+    total_links = admin_list_count(('shared_links',), SharedComparison.query, first_page=not after)
+    query = SharedComparison.query.options(db.joinedload(SharedComparison.user))
     
     # Apply sorting
-    if sort_by == 'view_count':
-        query = query.order_by(SharedComparison.view_count.desc() if order == 'desc' else SharedComparison.view_count.asc())
-    elif sort_by == 'is_active':
-        query = query.order_by(SharedComparison.is_active.desc() if order == 'desc' else SharedComparison.is_active.asc())
-    else:  # created_at
-        query = query.order_by(SharedComparison.created_at.desc() if order == 'desc' else SharedComparison.created_at.asc())
-    
-    shared_links = query.all()
+    sort_columns = {
+        'view_count': SharedComparison.view_count,
+        'is_active': SharedComparison.is_active,
+        'created_at': SharedComparison.created_at,
+    }
+    column = sort_columns.get(sort_by, SharedComparison.created_at)
+    shared_links, next_cursor = keyset_page(query, column, SharedComparison.id, order == 'desc', after)
     
     return render_template('admin_shared_links.html',
         shared_links=shared_links,
+        total_links=total_links,
+        next_cursor=next_cursor,
+        after=after,
         sort_by=sort_by,
         order=order
     )
@@ -761,6 +1000,7 @@ def admin_toggle_link(link_id):
     
     shared_link.is_active = not shared_link.is_active
     db.session.commit()
+    share_page_cache.delete(shared_link.token)
     
     status = 'activated' if shared_link.is_active else 'deactivated'
     return jsonify({'success': True, 'message': f'Link {status} successfully'})
@@ -775,7 +1015,8 @@ def admin_categories():
     show_inactive = request.args.get('show_inactive', 'false') == 'true'
     
     # Load all categories
-    all_cats = load_categories()
+    taxonomy = get_taxonomy()
+    all_cats = taxonomy.categories
     
     # Get count statistics
     total_categories = len(all_cats)
@@ -787,22 +1028,11 @@ def admin_categories():
     
     # Apply search filter if provided
     if search:
-        search_lower = search.lower()
         # Find all matching categories and their ancestors
         matching_ids = set()
-        id_to_cat = {c['id']: c for c in all_cats}
-        
-        for cat in all_cats:
-            if search_lower in cat['name'].lower():
-                # Add this category
-                matching_ids.add(cat['id'])
-                # Add all ancestors
-                current = cat
-                while current.get('parent_id'):
-                    matching_ids.add(current['parent_id'])
-                    current = id_to_cat.get(current['parent_id'])
-                    if not current:
-                        break
+        
+        for match in taxonomy.search_index().search(search, limit=len(all_cats), include_inactive=True):
+            matching_ids.update(match['path_ids'])
         
         categories_to_show = [c for c in all_cats if c['id'] in matching_ids]
     
@@ -818,77 +1048,100 @@ def admin_categories():
     )
 
 
+def set_categories_active(category_ids, active: bool, cascade: bool = True, include_ancestors: bool = False) -> int:
+    """
+    Activate or deactivate categories in one atomic UPDATE. With `cascade`,
+    each category's whole subtree is included (a slice of the taxonomy's
+    Euler tour); `include_ancestors` also covers the path up to the root so
+    re-activated categories are reachable in the tree. Returns rows updated.
+    """
+    taxonomy = get_taxonomy()
+    roots = list(dict.fromkeys(str(cid) for cid in category_ids if str(cid) in taxonomy.by_id))
+    if cascade:
+        # A selected category inside another selected subtree is already covered by that slice
+        roots = [cid for cid in roots
+                 if not any(other != cid and taxonomy.is_descendant(cid, other) for other in roots)]
+    affected = set()
+    for cid in roots:
+        affected.update(taxonomy.descendants(cid) if cascade else [cid])
+        if include_ancestors:
+            affected.update(taxonomy.ancestors(cid))
+    if not affected:
+        return 0
+    
+    count = Category.query.filter(Category.id.in_([int(cid) for cid in affected])).update({
+        Category.is_active: active,
+        Category.updated_at: datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+    invalidate_taxonomy()
+    return count
+
+
 @app.route('/admin/categories/<int:category_id>/toggle-active', methods=['POST'])
 @login_required
 @admin_required
 def admin_toggle_category(category_id):
     """Toggle category active status with cascading to children."""
     try:
-        csv_path = os.path.join(os.path.dirname(__file__), 'static', 'categories.csv')
-        
-        # Read all categories
-        rows = []
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            fieldnames = reader.fieldnames
-            for row in reader:
-                rows.append(row)
-        
-        # Find the target category
-        target_cat = next((r for r in rows if r['id'] == str(category_id)), None)
-        if not target_cat:
+        category = db.session.get(Category, category_id)
+        if not category:
             return jsonify({'success': False, 'error': 'Category not found'}), 404
         
         # Determine new status (toggle)
-        new_status = 'False' if target_cat.get('is_active', 'True') == 'True' else 'True'
-        
-        # If deactivating, cascade to all children
-        if new_status == 'False':
-            # Build parent-child relationships
-            children_map = {}
-            for row in rows:
-                parent_id = row.get('parent_id')
-                if parent_id:
-                    if parent_id not in children_map:
-                        children_map[parent_id] = []
-                    children_map[parent_id].append(row['id'])
-            
-            # Recursively find all descendants
-            def get_all_descendants(cat_id):
-                descendants = []
-                if cat_id in children_map:
-                    for child_id in children_map[cat_id]:
-                        descendants.append(child_id)
-                        descendants.extend(get_all_descendants(child_id))
-                return descendants
-            
-            affected_ids = [str(category_id)] + get_all_descendants(str(category_id))
-            
-            # Update all affected categories
-            for row in rows:
-                if row['id'] in affected_ids:
-                    row['is_active'] = new_status
-            
-            affected_count = len(affected_ids)
-        else:
-            # Just activate this single category
-            target_cat['is_active'] = new_status
-            affected_count = 1
+        new_status = not category.is_active
         
-        # Write back to CSV
-        with open(csv_path, 'w', encoding='utf-8', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(rows)
+        # Deactivation always cascades to all children; activation only when asked to
+        data = request.get_json(silent=True) or {}
+        cascade = not new_status or bool(data.get('cascade', False))
+        affected_count = set_categories_active([category_id], new_status, cascade=cascade)
         
-        status = 'activated' if new_status == 'True' else 'deactivated'
+        status = 'activated' if new_status else 'deactivated'
         message = f'Category {status} successfully'
         if affected_count > 1:
             message += f' ({affected_count} categories total including subcategories)'
         
         return jsonify({'success': True, 'message': message})
     except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/admin/categories/bulk-active', methods=['POST'])
+@login_required
+@admin_required
+def admin_bulk_category_active():
+    """
+    Activate or deactivate many categories (and their subtrees) at once.
+    JSON: {ids: [...], active: bool, cascade: bool = true, include_ancestors: bool = active}
+    """
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids or not isinstance(data.get('active'), bool):
+        return jsonify({'success': False, 'error': 'ids (list) and active (bool) are required'}), 400
+    
+    active = data['active']
+    taxonomy = get_taxonomy()
+    unknown = [cid for cid in ids if str(cid) not in taxonomy.by_id]
+    if unknown:
+        return jsonify({'success': False, 'error': 'Unknown category ids', 'unknown': unknown}), 404
+    
+    try:
+        affected_count = set_categories_active(
+            ids, active,
+            cascade=bool(data.get('cascade', True)),
+            include_ancestors=bool(data.get('include_ancestors', active))
+        )
+    except Exception as e:
+        db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
+    
+    status = 'activated' if active else 'deactivated'
+    return jsonify({
+        'success': True,
+        'affected': affected_count,
+        'message': f'{affected_count} categories {status}'
+    })
 
 
 # ============================
@@ -1083,14 +1336,16 @@ def edit_nutrition_page():
 # ============================
 # Taxonomy helpers
 # ============================
-def load_categories() -> List[Dict[str, str]]:
+CATEGORIES_CSV_PATH = os.path.join(os.path.dirname(__file__), 'static', 'categories.csv')
+
+
+def read_categories_csv() -> List[Dict[str, str]]:
     """
     Always loads from static/categories.csv
     CSV headers: id,parent_id,name,is_active
     """
     cats: List[Dict[str, str]] = []
-    static_path = os.path.join(os.path.dirname(__file__), 'static', 'categories.csv')
-    with open(static_path, encoding='utf-8') as f:
+    with open(CATEGORIES_CSV_PATH, encoding='utf-8') as f:
         reader = csv.DictReader(f)
         for row in reader:
             cats.append({
@@ -1101,6 +1356,352 @@ def load_categories() -> List[Dict[str, str]]:
             })
     return cats
 
+
+class TaxonomyIndex:
+    """
+    Read-only index over the category taxonomy, built once per process and
+    shared by every request: id lookup, parent and children maps, the leaf
+    set and breadcrumb paths.
+
+    The tree is also laid out in DFS preorder (an Euler tour): every node owns
+    the range preorder[tin:tout] holding its whole subtree, and the slice
+    leaf_order[leaf_start:leaf_end] holding its leaves. Expanding a node to
+    its leaves or descendants is then a slice, and "is descendant of" is a
+    range check.
+    """
+
+    def __init__(self, categories: List[Dict[str, str]]):
+        self.categories = categories
+        self.by_id: Dict[str, Dict[str, str]] = {str(c['id']): c for c in categories}
+        self.parent: Dict[str, Optional[str]] = {str(c['id']): (str(c['parent_id']) if c.get('parent_id') else None)
+                                                 for c in categories}
+        self.children: Dict[Optional[str], List[str]] = defaultdict(list)
+        for c in categories:
+            self.children[self.parent[str(c['id'])]].append(str(c['id']))
+        self.leaves = frozenset(cid for cid in self.by_id if not self.children.get(cid))
+        self.paths: Dict[str, str] = {cid: self._build_path(cid) for cid in self.by_id}
+        self._build_euler_tour()
+        self._active_tree_payload: Optional[Dict[str, Any]] = None
+        self._search_index: Optional['CategorySearchIndex'] = None
+
+    def _build_euler_tour(self) -> None:
+        self.preorder: List[str] = []
+        self.leaf_order: List[str] = []
+        self.tin: Dict[str, int] = {}
+        self.tout: Dict[str, int] = {}
+        self.leaf_start: Dict[str, int] = {}
+        self.leaf_end: Dict[str, int] = {}
+
+        def visit(root: str) -> None:
+            # Iterative DFS; (node, False) enters a node, (node, True) closes its range
+            stack = [(root, False)]
+            while stack:
+                node, closing = stack.pop()
+                if closing:
+                    self.tout[node] = len(self.preorder)
+                    self.leaf_end[node] = len(self.leaf_order)
+                    continue
+                if node in self.tin:
+                    continue  # guards against cycles in hand-edited data
+                self.tin[node] = len(self.preorder)
+                self.leaf_start[node] = len(self.leaf_order)
+                self.preorder.append(node)
+                if node in self.leaves:
+                    self.leaf_order.append(node)
+                stack.append((node, True))
+                for child in reversed(self.children.get(node, [])):
+                    if child not in self.tin:
+                        stack.append((child, False))
+
+        # Roots first (including nodes whose parent is unknown), then anything left over
+        for cid in self.by_id:
+            if self.parent[cid] not in self.by_id:
+                visit(cid)
+        for cid in self.by_id:
+            if cid not in self.tin:
+                visit(cid)
+
+    def _build_path(self, cid: str) -> str:
+        chain = []
+        seen = set()
+        cur = cid
+        while cur and cur in self.by_id and cur not in seen:
+            seen.add(cur)
+            chain.append(self.by_id[cur]['name'])
+            cur = self.parent.get(cur)
+        chain.reverse()
+        return " > ".join(chain)
+
+    def path(self, target_id) -> Optional[str]:
+        """Full breadcrumb like "Frukt & grønt > Frukt > Sitrusfrukt"."""
+        return self.paths.get(str(target_id)) or None
+
+    def ancestors(self, target_id) -> List[str]:
+        """Ids from the parent of target_id up to its root."""
+        result = []
+        cur = self.parent.get(str(target_id))
+        while cur and cur in self.by_id and cur not in result:
+            result.append(cur)
+            cur = self.parent.get(cur)
+        return result
+
+    def leaf_descendants(self, root_id) -> List[str]:
+        """
+        All descendant ids of root_id that are leaves (no children), in tree order.
+        If the root itself is a leaf, returns [root_id]; unknown ids give [].
+        """
+        rid = str(root_id)
+        if rid not in self.tin:
+            return []
+        return self.leaf_order[self.leaf_start[rid]:self.leaf_end[rid]]
+
+    def descendants(self, root_id, include_self: bool = True) -> List[str]:
+        """Every id in the subtree of root_id, in tree order."""
+        rid = str(root_id)
+        if rid not in self.tin:
+            return []
+        start = self.tin[rid] if include_self else self.tin[rid] + 1
+        return self.preorder[start:self.tout[rid]]
+
+    def is_descendant(self, node_id, ancestor_id) -> bool:
+        """True when node_id lies in the subtree of ancestor_id (a node is its own descendant)."""
+        nid, aid = str(node_id), str(ancestor_id)
+        if nid not in self.tin or aid not in self.tin:
+            return False
+        return self.tin[aid] <= self.tin[nid] < self.tout[aid]
+
+    def active_tree_payload(self) -> Dict[str, Any]:
+        """
+        The /category_tree response for this taxonomy version: active categories as
+        a nested tree, serialized and gzipped once, with a content-hash ETag.
+        """
+        if self._active_tree_payload is None:
+            active_cats = [c for c in self.categories if c.get('is_active', True)]
+            body = json.dumps({'tree': build_category_tree(active_cats)}, ensure_ascii=False,
+                              separators=(',', ':')).encode('utf-8')
+            self._active_tree_payload = {
+                'body': body,
+                'gzip': gzip.compress(body, compresslevel=9),
+                'etag': hashlib.sha256(body).hexdigest()[:32],
+            }
+        return self._active_tree_payload
+
+    def search_index(self) -> 'CategorySearchIndex':
+        """Typeahead index for this taxonomy version, built on first use."""
+        if self._search_index is None:
+            self._search_index = CategorySearchIndex(self)
+        return self._search_index
+
+
+SEARCH_FOLDING = str.maketrans({'æ': 'ae', 'ø': 'o', 'å': 'a'})
+SEARCH_GRAM_SIZE = 3
+
+
+def fold_search_text(text: str) -> str:
+    """
+    Lowercase and fold Norwegian letters (æ→ae, ø→o, å→a) and other accents,
+    so "Rømme", "romme" and "RØMME" all compare equal.
+    """
+    text = (text or '').lower().translate(SEARCH_FOLDING)
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def search_tokens(text: str) -> List[str]:
+    """Folded alphanumeric words of text."""
+    return [tok for tok in ''.join(ch if ch.isalnum() else ' ' for ch in fold_search_text(text)).split() if tok]
+
+
+class CategorySearchIndex:
+    """
+    N-gram index over folded category breadcrumbs. Every substring of up to
+    SEARCH_GRAM_SIZE letters of every path word maps to the categories whose
+    path contains it, so a query word (compound parts like "melk" in
+    "sjokolademelk" included) resolves by intersecting a few posting sets
+    instead of scanning the taxonomy.
+
+    A category matches when every query word occurs in its breadcrumb and at
+    least one occurs in its own name; results are ranked exact name, name
+    prefix, whole query in name, query words in name, word prefix, then
+    shallower and shorter first.
+    """
+
+    def __init__(self, taxonomy: TaxonomyIndex):
+        self.taxonomy = taxonomy
+        self.names: Dict[str, str] = {}
+        self.paths: Dict[str, str] = {}
+        self.name_words: Dict[str, List[str]] = {}
+        self.depth: Dict[str, int] = {}
+        self.postings: Dict[str, Set[str]] = defaultdict(set)
+        for cid, cat in taxonomy.by_id.items():
+            self.names[cid] = fold_search_text(cat['name'])
+            self.paths[cid] = fold_search_text(taxonomy.paths[cid])
+            self.name_words[cid] = search_tokens(cat['name'])
+            self.depth[cid] = len(taxonomy.ancestors(cid))
+            for word in search_tokens(taxonomy.paths[cid]):
+                for size in range(1, SEARCH_GRAM_SIZE + 1):
+                    for i in range(len(word) - size + 1):
+                        self.postings[word[i:i + size]].add(cid)
+
+    def _candidates(self, word: str) -> Set[str]:
+        if len(word) <= SEARCH_GRAM_SIZE:
+            return self.postings.get(word, set())
+        grams = sorted((self.postings.get(word[i:i + SEARCH_GRAM_SIZE], set())
+                        for i in range(len(word) - SEARCH_GRAM_SIZE + 1)), key=len)
+        result = set(grams[0])
+        for posting in grams[1:]:
+            result &= posting
+            if not result:
+                break
+        # N-grams can co-occur without forming the word; confirm on the path
+        return {cid for cid in result if word in self.paths[cid]}
+
+    def search(self, query: str, limit: int = 20, include_inactive: bool = False) -> List[Dict[str, Any]]:
+        """Ranked matches as [{id, name, path, path_ids, is_active}]."""
+        return self.search_with_total(query, limit, include_inactive)[0]
+
+    def search_with_total(self, query: str, limit: int = 20,
+                          include_inactive: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        """Like search(), plus the number of matches before the limit was applied."""
+        ranked = self._ranked(query, include_inactive)
+        return [self._result(cid) for cid in ranked[:limit]], len(ranked)
+
+    def _ranked(self, query: str, include_inactive: bool) -> List[str]:
+        words = search_tokens(query)
+        if not words:
+            return []
+        candidates: Optional[Set[str]] = None
+        for word in sorted(set(words), key=len, reverse=True):
+            found = self._candidates(word)
+            candidates = found if candidates is None else candidates & found
+            if not candidates:
+                return []
+
+        folded_query = ' '.join(words)
+        scored = []
+        for cid in candidates:
+            cat = self.taxonomy.by_id[cid]
+            if not include_inactive and not cat.get('is_active', True):
+                continue
+            name = self.names[cid]
+            if not any(word in name for word in words):
+                continue
+            rank = (
+                name != folded_query,
+                not name.startswith(folded_query),
+                folded_query not in name,
+                -sum(word in name for word in words),
+                not any(nw.startswith(word) for word in words for nw in self.name_words[cid]),
+                self.depth[cid],
+                len(name),
+                name,
+            )
+            scored.append((rank, cid))
+        scored.sort()
+        return [cid for _, cid in scored]
+
+    def _result(self, cid: str) -> Dict[str, Any]:
+        cat = self.taxonomy.by_id[cid]
+        return {
+            'id': cid,
+            'name': cat['name'],
+            'path': self.taxonomy.paths[cid],
+            'path_ids': list(reversed(self.taxonomy.ancestors(cid))) + [cid],
+            'is_active': cat.get('is_active', True),
+        }
+
+
+def import_categories_from_csv(replace: bool = False) -> int:
+    """
+    Load static/categories.csv into the categories table. Existing rows keep
+    their is_active flag unless `replace` is set, which rewrites the table
+    from the file. Returns the number of rows written.
+    """
+    rows = read_categories_csv()
+    now = datetime.utcnow()
+    if replace:
+        Category.query.delete(synchronize_session=False)
+        existing = {}
+    else:
+        existing = {c.id: c for c in Category.query.all()}
+    for row in rows:
+        cid = int(row['id'])
+        parent_id = int(row['parent_id']) if row['parent_id'] else None
+        category = existing.get(cid)
+        if category is None:
+            db.session.add(Category(id=cid, parent_id=parent_id, name=row['name'],
+                                    is_active=row['is_active'], updated_at=now))
+        elif category.parent_id != parent_id or category.name != row['name']:
+            category.parent_id = parent_id
+            category.name = row['name']
+            category.updated_at = now
+    db.session.commit()
+    return len(rows)
+
+
+TAXONOMY_CHECK_INTERVAL = float(os.environ.get('TAXONOMY_CHECK_INTERVAL', '5'))  # seconds
+
+_taxonomy: Optional[TaxonomyIndex] = None
+_taxonomy_version: Optional[tuple] = None
+_taxonomy_checked_at = 0.0
+_taxonomy_lock = threading.Lock()
+
+
+def taxonomy_version() -> Optional[tuple]:
+    """Cheap change marker for the categories table: (row count, last update). None if the table is missing."""
+    from sqlalchemy.exc import OperationalError, ProgrammingError
+    try:
+        count, last_update = db.session.query(db.func.count(Category.id), db.func.max(Category.updated_at)).one()
+    except (OperationalError, ProgrammingError):
+        db.session.rollback()
+        return None
+    return count, last_update
+
+
+def read_categories() -> List[Dict[str, str]]:
+    """All categories from the database, seeding the table from categories.csv on first use."""
+    if not db.session.query(Category.id).first():
+        print("Seeding categories table from categories.csv")
+        import_categories_from_csv()
+    return [c.to_dict() for c in Category.query.order_by(Category.id).all()]
+
+
+def get_taxonomy() -> TaxonomyIndex:
+    """
+    The process-wide TaxonomyIndex. Every TAXONOMY_CHECK_INTERVAL seconds the
+    categories table's version is compared, so edits made by another worker
+    show up without a restart. Falls back to categories.csv until the
+    categories table has been created (see import_categories.py).
+    """
+    global _taxonomy, _taxonomy_version, _taxonomy_checked_at
+    now = time.monotonic()
+    if _taxonomy is not None and now - _taxonomy_checked_at < TAXONOMY_CHECK_INTERVAL:
+        return _taxonomy
+    with _taxonomy_lock:
+        version = taxonomy_version()
+        if _taxonomy is None or version != _taxonomy_version:
+            if version is None:
+                _taxonomy = TaxonomyIndex(read_categories_csv())
+            else:
+                _taxonomy = TaxonomyIndex(read_categories())
+                version = taxonomy_version()
+            _taxonomy_version = version
+        _taxonomy_checked_at = now
+        return _taxonomy
+
+
+def invalidate_taxonomy() -> None:
+    """Force the next get_taxonomy() call to re-check the database (after the admin edits categories)."""
+    global _taxonomy_checked_at
+    with _taxonomy_lock:
+        _taxonomy_checked_at = 0.0
+
+
+def load_categories() -> List[Dict[str, str]]:
+    """Flat category list from the shared taxonomy index. Treat as read-only."""
+    return get_taxonomy().categories
+
+
 def build_category_tree(categories: List[Dict[str, str]]) -> List[Dict[str, Any]]:
     """
     Turns flat list into a nested tree for your front-end selectors.
@@ -1126,64 +1727,6 @@ def build_category_tree(categories: List[Dict[str, str]]) -> List[Dict[str, Any]
         tree.append(build_node(cat))
     return tree
 
-# Build a full breadcrumb from a target id
-def find_category_path(categories: List[Dict[str, str]], target_id: str) -> Optional[str]:
-    by_id = {str(c['id']): c for c in categories}
-    parent = {str(c['id']): str(c.get('parent_id') or '') for c in categories}
-
-    tid = str(target_id)
-    if tid not in by_id:
-        return None
-
-    chain = []
-    seen = set()
-    cur = tid
-    while cur and cur in by_id and cur not in seen:
-        seen.add(cur)
-        chain.append(by_id[cur]['name'])
-        cur = parent.get(cur) or ''
-        if not cur:
-            break
-
-    chain.reverse()
-    return " > ".join(chain) if chain else None
-
-
-def build_children_index(categories: List[Dict[str, str]]) -> Dict[Optional[str], List[Dict[str, str]]]:
-    children: Dict[Optional[str], List[Dict[str, str]]] = defaultdict(list)
-    for c in categories:
-        children[c.get('parent_id')].append(c)
-    return children
-
-
-def get_leaf_descendants(categories: List[Dict[str, str]], root_id: str) -> List[str]:
-    """
-    Given a flat categories list and a root id, return all descendant ids that are leaves (no children).
-    If the root itself is a leaf, return [root_id].
-    """
-    by_id = {str(c['id']): c for c in categories}
-    children_index = build_children_index(categories)
-
-    root = by_id.get(str(root_id))
-    if not root:
-        return []
-
-    # BFS to collect descendants; then filter leaves
-    result: List[str] = []
-    q: deque[Dict[str, str]] = deque([root])
-
-    while q:
-        node = q.popleft()
-        node_id = str(node['id'])
-        kids = children_index.get(node_id, [])
-        if not kids:
-            result.append(node_id)
-        else:
-            for k in kids:
-                q.append(k)
-
-    return result
-
 
 # ============================
 # Merge helper (server-side union)
@@ -1209,37 +1752,754 @@ def add_unique_categories(suggestions: List[Dict[str, Any]],
 
 
 # ============================
-# Page routes
+# Buffered counters
 # ============================
-@app.route('/comparison')
-@login_required
-def comparison():
-    return render_template('comparison.html', product_data=session.get('product_data'))
+class BufferedCounter:
+    """
+    Accumulates increments in memory and hands them to `flush_fn` as one
+    {key: n} batch at most every `interval` seconds, keeping per-request
+    writes off the hot path.
+    """
 
+    def __init__(self, flush_fn, interval: float):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self._pending: Dict[Any, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def add(self, key, n: int = 1) -> None:
+        with self._lock:
+            self._pending[key] += n
+            due = time.monotonic() - self._last_flush >= self.interval
+        if due:
+            self.flush()
+
+    def pending(self, key) -> int:
+        with self._lock:
+            return self._pending.get(key, 0)
+
+    def flush(self) -> None:
+        with self._lock:
+            batch = dict(self._pending)
+            self._pending.clear()
+            self._last_flush = time.monotonic()
+        if not batch:
+            return
+        try:
+            self.flush_fn(batch)
+        except Exception as e:
+            print(f"Error flushing counters: {e}")
+            # Put the increments back so the next flush retries them
+            with self._lock:
+                for key, n in batch.items():
+                    self._pending[key] += n
 
-@app.route('/create-share-link', methods=['POST'])
-@login_required
-def create_share_link():
-    """Create a shareable link for the current comparison (premium only)."""
-    if not current_user.is_subscribed():
-        return jsonify({'error': 'Share feature is available for premium users only'}), 403
-    
+
+def flush_category_demand(batch: Dict[str, int]) -> None:
+    today = datetime.utcnow().date()
     try:
-        data = request.json
-        comparison_data = data.get('comparison_data')
-        
-        if not comparison_data:
-            return jsonify({'error': 'No comparison data provided'}), 400
-        
-        # Generate unique token
-        token = secrets.token_urlsafe(16)
-        
-        # Create shared comparison
-        shared_comp = SharedComparison(
-            user_id=current_user.id,
-            token=token,
-            comparison_data=comparison_data
-        )
+        for category_id, n in batch.items():
+            updated = CategoryDemand.query.filter_by(category_id=category_id, day=today).update({
+                CategoryDemand.request_count: CategoryDemand.request_count + n
+            }, synchronize_session=False)
+            if not updated:
+                db.session.add(CategoryDemand(category_id=category_id, day=today, request_count=n))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def flush_share_views(batch: Dict[int, int]) -> None:
+    # One atomic UPDATE per distinct increment, covering every link that got that many views
+    by_increment: Dict[int, List[int]] = defaultdict(list)
+    for link_id, n in batch.items():
+        by_increment[n].append(link_id)
+    try:
+        for n, link_ids in by_increment.items():
+            SharedComparison.query.filter(SharedComparison.id.in_(link_ids)).update({
+                SharedComparison.view_count: db.func.coalesce(SharedComparison.view_count, 0) + n
+            }, synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+CATEGORY_DEMAND_FLUSH_INTERVAL = int(os.environ.get('CATEGORY_DEMAND_FLUSH_INTERVAL', '60'))
+category_demand = BufferedCounter(flush_category_demand, CATEGORY_DEMAND_FLUSH_INTERVAL)
+
+SHARE_VIEW_FLUSH_INTERVAL = int(os.environ.get('SHARE_VIEW_FLUSH_INTERVAL', '30'))
+share_views = BufferedCounter(flush_share_views, SHARE_VIEW_FLUSH_INTERVAL)
+
+
+def flush_counters_at_exit():
+    with app.app_context():
+        category_demand.flush()
+        share_views.flush()
+
+
+atexit.register(flush_counters_at_exit)
+
+
+# ============================
+# Background janitor
+# ============================
+JANITOR_INTERVAL = int(os.environ.get('JANITOR_INTERVAL', '300'))  # seconds
+
+
+class Janitor:
+    """Daemon thread that runs registered maintenance tasks every `interval` seconds."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.tasks = []
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def register(self, task):
+        self.tasks.append(task)
+        return task
+
+    def run_once(self) -> None:
+        for task in self.tasks:
+            with app.app_context():
+                try:
+                    task()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"[janitor] {task.__name__} failed: {e}")
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.run_once()
+
+    def start(self) -> None:
+        # Started lazily from the first request so each gunicorn worker runs its own thread after fork
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='janitor', daemon=True)
+                self._thread.start()
+
+
+janitor = Janitor(JANITOR_INTERVAL)
+janitor.register(category_demand.flush)
+janitor.register(share_views.flush)
+
+
+@app.before_request
+def start_background_jobs():
+    janitor.start()
+
+
+# ============================
+# Product listing cache
+# ============================
+PRODUCT_CACHE_TTL = int(os.environ.get('PRODUCT_CACHE_TTL', '900'))  # seconds a page counts as fresh
+PRODUCT_CACHE_STALE_TTL = int(os.environ.get('PRODUCT_CACHE_STALE_TTL', '86400'))  # max age served while refreshing
+PRODUCT_CACHE_MAX_ENTRIES = int(os.environ.get('PRODUCT_CACHE_MAX_ENTRIES', '1000'))
+PRODUCT_CACHE_PERSIST = os.environ.get('PRODUCT_CACHE_PERSIST', 'false').lower() == 'true'
+
+# Product fields find_products reads; everything else is dropped before caching
+LISTING_PRODUCT_FIELDS = (
+    'id', 'name', 'ean', 'brand', 'current_price', 'current_unit_price', 'weight', 'weight_unit',
+    'image', 'url', 'updated_at', 'nutrition', 'allergens', 'store', 'category',
+    'ingredients', 'description', 'vendor'
+)
+
+
+class LRUCache:
+    """Thread-safe LRU map of key -> (value, stored_at epoch seconds)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Any, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, stored_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (value, stored_at if stored_at is not None else time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def slim_listing_page(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only what find_products needs from a Kassal listing page."""
+    return {
+        'data': [
+            {k: product.get(k) for k in LISTING_PRODUCT_FIELDS if k in product}
+            for product in body.get('data', [])
+        ],
+        'links': {'next': (body.get('links') or {}).get('next')},
+        'meta': {'last_page': (body.get('meta') or {}).get('last_page')},
+    }
+
+
+def load_persisted_listing(category_id: str, page: int) -> Optional[tuple]:
+    with app.app_context():
+        row = db.session.get(ProductListingCache, (category_id, page))
+        if not row:
+            return None
+        return row.data, row.fetched_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+def persist_listing(category_id: str, page: int, data: Dict[str, Any], fetched_at: float) -> None:
+    with app.app_context():
+        try:
+            db.session.merge(ProductListingCache(
+                category_id=category_id,
+                page=page,
+                data=data,
+                fetched_at=datetime.utcfromtimestamp(fetched_at)
+            ))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error persisting listing {category_id}:{page}: {e}")
+
+
+class ProductListingCacheLayer:
+    """
+    Cache of Kassal listing pages keyed by (category_id, page).
+
+    Fresh pages (younger than `ttl`) are served directly. Stale pages (younger
+    than `stale_ttl`) are served immediately while a background refresh runs
+    on the fetch engine loop. The in-memory tier is LRU bounded per worker;
+    the optional persistent tier (PRODUCT_CACHE_PERSIST=true) is shared by
+    all workers and instances through the product_listing_cache table.
+    """
+
+    def __init__(self, ttl: int, stale_ttl: int, max_entries: int, persist: bool):
+        self.ttl = ttl
+        self.stale_ttl = max(ttl, stale_ttl)
+        self.persist = persist
+        self.memory = LRUCache(max_entries)
+        # Running background refreshes by key; also keeps the tasks referenced until they finish
+        self._refreshing: Dict[tuple, asyncio.Task] = {}
+
+    async def lookup(self, key: tuple) -> Optional[tuple]:
+        entry = self.memory.get(key)
+        if entry is None and self.persist:
+            try:
+                entry = await asyncio.to_thread(load_persisted_listing, *key)
+            except Exception as e:
+                print(f"Error reading persisted listing {key}: {e}")
+                entry = None
+            if entry is not None:
+                self.memory.set(key, entry[0], entry[1])
+        return entry
+
+    async def get_page(self, engine: 'KassalFetchEngine', api_token: str, category_id: str, page: int) -> Optional[Dict[str, Any]]:
+        key = (str(category_id), page)
+        entry = await self.lookup(key)
+        if entry is not None:
+            data, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                return data
+            if age < self.stale_ttl:
+                if key not in self._refreshing:
+                    task = asyncio.create_task(self.refresh(engine, api_token, key))
+                    self._refreshing[key] = task
+                    task.add_done_callback(lambda t, key=key: self._refresh_done(key, t))
+                return data
+        return await self.refresh(engine, api_token, key)
+
+    def _refresh_done(self, key: tuple, task: asyncio.Task) -> None:
+        self._refreshing.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error refreshing listing {key}: {task.exception()}")
+
+    async def refresh(self, engine: 'KassalFetchEngine', api_token: str, key: tuple) -> Optional[Dict[str, Any]]:
+        """Fetch a page from upstream and store it in every tier."""
+        body = await engine.fetch_products_page_upstream(api_token, key[0], key[1])
+        if not body:
+            return None
+        data = slim_listing_page(body)
+        fetched_at = time.time()
+        self.memory.set(key, data, fetched_at)
+        if self.persist:
+            await asyncio.to_thread(persist_listing, key[0], key[1], data, fetched_at)
+        return data
+
+
+# ============================
+# User session cache
+# ============================
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '30'))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', '2000'))
+
+USER_CACHE_COLUMNS = [attr.key for attr in User.__mapper__.column_attrs]
+user_cache = LRUCache(USER_CACHE_MAX_ENTRIES)
+
+
+def invalidate_user_cache(user_id) -> None:
+    user_cache.delete(int(user_id))
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_changed_users(session, flush_context):
+    # Includes subscription changes made by the Stripe webhook handlers
+    changed = {obj.id for obj in list(session.dirty) + list(session.deleted) if isinstance(obj, User)}
+    if changed:
+        session.info.setdefault('changed_user_ids', set()).update(changed)
+
+
+@event.listens_for(db.session, 'after_commit')
+def drop_changed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        invalidate_user_cache(user_id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    """
+    Rebuild current_user from a recent snapshot of the users row instead of a
+    SELECT per request. Commits that change a user drop its snapshot in this
+    process; other workers see the change within USER_CACHE_TTL seconds.
+    """
+    uid = int(user_id)
+    entry = user_cache.get(uid)
+    if entry is not None and time.time() - entry[1] < USER_CACHE_TTL:
+        user = User(**entry[0])
+        make_transient_to_detached(user)
+        # Attach without loading so writes through current_user keep working
+        return db.session.merge(user, load=False)
+    
+    user = db.session.get(User, uid)
+    if user is not None:
+        user_cache.set(uid, {key: getattr(user, key) for key in USER_CACHE_COLUMNS})
+    return user
+
+
+# ============================
+# Kassal API fetch engine
+# ============================
+KASSAL_API_BASE = 'https://kassal.app/api/v1'
+KASSAL_PAGE_SIZE = 100  # Max allowed by API
+KASSAL_RATE_LIMIT = 60  # requests per minute
+KASSAL_RATE_WINDOW = 60  # seconds
+KASSAL_MAX_CONCURRENCY = int(os.environ.get('KASSAL_MAX_CONCURRENCY', '8'))
+KASSAL_TIMEOUT = float(os.environ.get('KASSAL_TIMEOUT', '30'))
+
+
+KASSAL_RATE_BURST = int(os.environ.get('KASSAL_RATE_BURST', '10'))
+KASSAL_RATE_LIMIT_DB = os.environ.get('KASSAL_RATE_LIMIT_DB', os.path.join(basedir, 'kassal_rate_limit.db'))
+KASSAL_MAX_RETRIES = 3
+
+
+class SharedTokenBucket:
+    """
+    Token bucket persisted in a small SQLite file, so every request in every
+    gunicorn worker on this host draws from one Kassal API budget.
+
+    The bucket holds at most `burst` tokens and refills at
+    (rate_limit - burst) / window tokens per second, which keeps any rolling
+    window at or below `rate_limit` requests.
+    """
+
+    def __init__(self, path: str, rate_limit: int, window: float, burst: int, name: str = 'kassal'):
+        self.path = path
+        self.name = name
+        self.capacity = float(max(1, min(burst, rate_limit - 1)))
+        self.refill_rate = (rate_limit - self.capacity) / window
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS token_bucket ('
+                'name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+            )
+            self._local.conn = conn
+        return conn
+
+    def _update(self, fn):
+        """Run fn(tokens) -> (new_tokens, result) atomically across processes."""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute(
+                'SELECT tokens, updated_at FROM token_bucket WHERE name = ?', (self.name,)
+            ).fetchone()
+            if row is None:
+                tokens = self.capacity
+            else:
+                tokens = min(self.capacity, row[0] + max(0.0, now - row[1]) * self.refill_rate)
+            tokens, result = fn(tokens)
+            conn.execute(
+                'INSERT OR REPLACE INTO token_bucket (name, tokens, updated_at) VALUES (?, ?, ?)',
+                (self.name, tokens, now)
+            )
+            conn.execute('COMMIT')
+            return result
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def try_acquire(self, reserve: float = 0) -> float:
+        """
+        Take one token. Returns 0 on success, otherwise the seconds to wait before retrying.
+        Low-priority callers pass a `reserve`: they only take a token when more than
+        `reserve` tokens would be left for everyone else.
+        """
+        def take(tokens):
+            if tokens >= 1 + reserve:
+                return tokens - 1, 0.0
+            return tokens, (1 + reserve - tokens) / self.refill_rate
+        return self._update(take)
+
+    def penalize(self, seconds: float) -> None:
+        """Drain the bucket so nobody calls upstream for `seconds` (e.g. after a 429)."""
+        self._update(lambda tokens: (min(tokens, 0.0) - seconds * self.refill_rate, None))
+
+    def acquire_blocking(self, reserve: float = 0) -> None:
+        while True:
+            wait = self.try_acquire(reserve)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire(self, reserve: float = 0) -> None:
+        while True:
+            wait = await asyncio.to_thread(self.try_acquire, reserve)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+def retry_after_seconds(headers, default: float = KASSAL_RATE_WINDOW) -> float:
+    """Parse a Retry-After header (seconds form), falling back to a full rate window."""
+    try:
+        return max(1.0, float(headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return float(default)
+
+
+kassal_rate_limiter = SharedTokenBucket(KASSAL_RATE_LIMIT_DB, KASSAL_RATE_LIMIT, KASSAL_RATE_WINDOW, KASSAL_RATE_BURST)
+
+
+class KassalFetchEngine:
+    """
+    Runs Kassal API calls concurrently on a background event loop that owns a
+    single shared httpx.AsyncClient, so Flask views can fan out over many leaf
+    categories and pages while connections are reused across requests.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+        # Tokens left untouched for interactive traffic; raised by background jobs
+        self.rate_reserve = 0
+        self.cache = ProductListingCacheLayer(
+            PRODUCT_CACHE_TTL, PRODUCT_CACHE_STALE_TTL, PRODUCT_CACHE_MAX_ENTRIES, PRODUCT_CACHE_PERSIST
+        )
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        # Started lazily so each gunicorn worker gets its own loop thread after fork
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='kassal-fetch', daemon=True)
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro):
+        """Schedule a coroutine on the engine loop and return a concurrent Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """Run a coroutine on the engine loop and block until it finishes."""
+        return self.submit(coro).result(timeout)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=KASSAL_API_BASE,
+                timeout=KASSAL_TIMEOUT,
+                limits=httpx.Limits(max_connections=KASSAL_MAX_CONCURRENCY),
+            )
+        return self._client
+
+    async def get_json(self, api_token: str, path: str, params: Optional[Dict[str, Any]] = None) -> Optional[Any]:
+        """GET a Kassal API path, returning the decoded body or None on a non-200."""
+        client = self._get_client()
+        for attempt in range(KASSAL_MAX_RETRIES):
+            await kassal_rate_limiter.acquire(self.rate_reserve)
+            request = client.build_request('GET', path, params=params, headers={
+                'Authorization': f'Bearer {api_token}',
+                'Accept': 'application/json'
+            })
+            # Print the fully resolved GET URL for troubleshooting (copyable into Postman)
+            print(f"[GET] {request.url}")
+            response = await client.send(request)
+            if response.status_code == 429:
+                # Upstream quota exceeded: pause every worker, then retry this call
+                wait = retry_after_seconds(response.headers)
+                print(f"Rate limited by Kassal API, backing off {wait:.0f}s (attempt {attempt + 1})")
+                await asyncio.to_thread(kassal_rate_limiter.penalize, wait)
+                continue
+            if response.status_code != 200:
+                print(f"API error for {path} {params or ''}: {response.status_code}")
+                return None
+            return response.json()
+        return None
+
+    async def fetch_products_page(self, api_token: str, category_id: str, page: int) -> Optional[Dict[str, Any]]:
+        """Return one listing page, served from the product listing cache when possible."""
+        return await self.cache.get_page(self, api_token, category_id, page)
+
+    async def fetch_products_page_upstream(self, api_token: str, category_id: str, page: int) -> Optional[Dict[str, Any]]:
+        params = {
+            'category_id': int(category_id),  # API expects integer
+            'size': KASSAL_PAGE_SIZE,
+            'page': page
+        }
+        try:
+            return await self.get_json(api_token, '/products', params)
+        except Exception as e:
+            print(f"Error fetching products for category {category_id} page {page}: {e}")
+            return None
+
+    async def fetch_category(self, api_token: str, category_id: str, on_page=None) -> List[Dict[str, Any]]:
+        """
+        Fetch every page of one category. When the first page reports how many
+        pages exist, the remaining pages are requested in parallel; otherwise the
+        `links.next` chain is followed page by page.
+
+        With `on_page`, each page is handed to on_page(category_id, body) as soon
+        as it arrives instead of being collected into the returned list.
+        """
+        pages: List[Dict[str, Any]] = []
+
+        def emit(body: Dict[str, Any]) -> None:
+            if on_page:
+                on_page(category_id, body)
+            else:
+                pages.append(body)
+
+        first = await self.fetch_products_page(api_token, category_id, 1)
+        if not first:
+            return pages
+        emit(first)
+
+        last_page = (first.get('meta') or {}).get('last_page')
+        if isinstance(last_page, int) and last_page > 1:
+            async def fetch_page(page: int) -> Optional[Dict[str, Any]]:
+                body = await self.fetch_products_page(api_token, category_id, page)
+                if body and on_page:
+                    on_page(category_id, body)
+                return body
+
+            rest = await asyncio.gather(*(fetch_page(page) for page in range(2, last_page + 1)))
+            if not on_page:
+                for body in rest:
+                    if not body:
+                        break
+                    pages.append(body)
+            return pages
+
+        page = 1
+        body = first
+        while body.get('data') and (body.get('links') or {}).get('next'):
+            page += 1
+            body = await self.fetch_products_page(api_token, category_id, page)
+            if not body:
+                break
+            emit(body)
+        return pages
+
+    async def fetch_categories(self, api_token: str, category_ids: List[str], on_page=None) -> Dict[str, List[Dict[str, Any]]]:
+        """Fetch all pages of all categories concurrently, keyed by category id."""
+        semaphore = asyncio.Semaphore(KASSAL_MAX_CONCURRENCY)
+
+        async def bounded(category_id: str) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await self.fetch_category(api_token, category_id, on_page)
+
+        results = await asyncio.gather(*(bounded(cid) for cid in category_ids))
+        return dict(zip(category_ids, results))
+
+    def stream_categories(self, api_token: str, category_ids: List[str]):
+        """Yield (category_id, page body) in arrival order while the crawl runs on the engine loop."""
+        pages: queue.Queue = queue.Queue()
+        done = object()
+
+        async def crawl():
+            try:
+                await self.fetch_categories(api_token, category_ids, on_page=lambda cid, body: pages.put((cid, body)))
+            finally:
+                pages.put(done)
+
+        future = self.submit(crawl())
+        finished = False
+        try:
+            while True:
+                item = pages.get()
+                if item is done:
+                    finished = True
+                    break
+                yield item
+        finally:
+            if not finished:
+                # Consumer went away (e.g. client disconnected): stop spending rate limit on the crawl
+                future.cancel()
+        future.result()
+
+
+kassal_engine = KassalFetchEngine()
+
+
+# ============================
+# Category warm-up (background job, see warmup.py)
+# ============================
+WARMUP_INTERVAL = int(os.environ.get('WARMUP_INTERVAL', '600'))  # seconds between runs
+WARMUP_TOP_CATEGORIES = int(os.environ.get('WARMUP_TOP_CATEGORIES', '50'))
+WARMUP_DEMAND_WINDOW_DAYS = int(os.environ.get('WARMUP_DEMAND_WINDOW_DAYS', '7'))
+WARMUP_RATE_RESERVE = int(os.environ.get('WARMUP_RATE_RESERVE', '5'))  # tokens kept for interactive traffic
+
+
+def get_hot_categories(limit: int = WARMUP_TOP_CATEGORIES) -> List[str]:
+    """
+    Rank leaf categories by demand: every saved search counts once per leaf it
+    expands to, and find_products calls add their daily request counts from
+    the last WARMUP_DEMAND_WINDOW_DAYS days.
+    """
+    from datetime import timedelta
+    taxonomy = get_taxonomy()
+    known_ids = {c['id'] for c in taxonomy.categories if c.get('is_active', True)}
+    counts: Dict[str, int] = defaultdict(int)
+
+    for (selected,) in db.session.query(SavedSearch.selected_categories).all():
+        for category in selected or []:
+            cid = str(category.get('id')) if isinstance(category, dict) else str(category)
+            for lid in taxonomy.leaf_descendants(cid):
+                counts[lid] += 1
+
+    since = (datetime.utcnow() - timedelta(days=WARMUP_DEMAND_WINDOW_DAYS)).date()
+    recent = db.session.query(CategoryDemand.category_id, db.func.sum(CategoryDemand.request_count)) \
+        .filter(CategoryDemand.day >= since).group_by(CategoryDemand.category_id)
+    for category_id, total in recent:
+        counts[category_id] += int(total or 0)
+
+    ranked = sorted((cid for cid in counts if cid in known_ids), key=lambda cid: (-counts[cid], cid))
+    return ranked[:limit]
+
+
+def prune_category_demand() -> None:
+    """Drop daily demand buckets that have fallen out of the ranking window."""
+    from datetime import timedelta
+    cutoff = (datetime.utcnow() - timedelta(days=WARMUP_DEMAND_WINDOW_DAYS)).date()
+    try:
+        CategoryDemand.query.filter(CategoryDemand.day < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"[warmup] Error pruning category demand: {e}")
+
+
+async def warm_category(api_token: str, category_id: str) -> int:
+    """Refresh every page of a category whose cached copy is missing or past half its TTL."""
+    cache = kassal_engine.cache
+    refreshed = 0
+    page = 1
+    while True:
+        key = (str(category_id), page)
+        entry = await cache.lookup(key)
+        if entry is None or time.time() - entry[1] >= cache.ttl / 2:
+            data = await cache.refresh(kassal_engine, api_token, key)
+            refreshed += 1
+        else:
+            data = entry[0]
+        if not data or not data.get('data') or not (data.get('links') or {}).get('next'):
+            return refreshed
+        page += 1
+
+
+def run_category_warmup() -> int:
+    """One warm-up pass over the hottest categories. Returns the number of pages fetched upstream."""
+    api_token = os.environ.get('KASSAL_API_TOKEN')
+    if not api_token:
+        print("[warmup] KASSAL_API_TOKEN not configured, skipping")
+        return 0
+
+    with app.app_context():
+        category_ids = get_hot_categories()
+        prune_category_demand()
+
+    print(f"[warmup] Warming {len(category_ids)} categories")
+    refreshed = 0
+    for category_id in category_ids:
+        try:
+            refreshed += kassal_engine.run(warm_category(api_token, category_id))
+        except Exception as e:
+            print(f"[warmup] Error warming category {category_id}: {e}")
+    print(f"[warmup] Done, refreshed {refreshed} pages")
+    return refreshed
+
+
+# ============================
+# Page routes
+# ============================
+@app.route('/comparison')
+@login_required
+def comparison():
+    return render_template('comparison.html', product_data=session.get('product_data'))
+
+
+@app.route('/create-share-link', methods=['POST'])
+@login_required
+def create_share_link():
+    """Create a shareable link for the current comparison (premium only)."""
+    if not current_user.is_subscribed():
+        return jsonify({'error': 'Share feature is available for premium users only'}), 403
+    
+    try:
+        data = request.json
+        comparison_data = data.get('comparison_data')
+        
+        if not comparison_data or not isinstance(comparison_data, dict):
+            return jsonify({'error': 'No comparison data provided'}), 400
+        
+        # Generate unique token
+        token = secrets.token_urlsafe(16)
+        
+        # Create shared comparison pointing at the (deduplicated) snapshot
+        shared_comp = SharedComparison(
+            user_id=current_user.id,
+            token=token,
+            snapshot_hash=store_comparison_snapshot(comparison_data)
+        )
         
         db.session.add(shared_comp)
         db.session.commit()
@@ -1254,33 +2514,177 @@ def create_share_link():
         })
     
     except Exception as e:
+        db.session.rollback()
         print(f"Error creating share link: {e}")
         return jsonify({'error': 'Failed to create share link'}), 500
 
 
-@app.route('/share/<token>')
-def view_shared_comparison(token):
-    """Public view of a shared comparison (no login required)."""
-    shared_comp = SharedComparison.query.filter_by(token=token, is_active=True).first()
+SNAPSHOT_LOOKUP_CHUNK = 500
+
+
+def canonical_json(value) -> bytes:
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def content_hash(encoded: bytes) -> str:
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def store_comparison_snapshot(comparison_data: Dict[str, Any]) -> str:
+    """
+    Store comparison_data content-addressed and return its snapshot hash.
+    Each product dict becomes a ProductRecord keyed by the hash of its canonical
+    JSON; the snapshot keeps the remaining fields plus the list of product
+    hashes. Identical products and identical comparisons are stored once, no
+    matter how often they are shared.
+    """
+    products = comparison_data.get('products') or []
+    rest = {k: v for k, v in comparison_data.items() if k != 'products'}
+    
+    encoded_products: Dict[str, bytes] = {}
+    product_hashes = []
+    for product in products:
+        encoded = canonical_json(product)
+        digest = content_hash(encoded)
+        encoded_products[digest] = encoded
+        product_hashes.append(digest)
+    
+    document = canonical_json({'meta': rest, 'products': product_hashes})
+    snapshot_hash = content_hash(document)
+    
+    from sqlalchemy.exc import IntegrityError
+    for attempt in range(2):
+        if db.session.get(ComparisonSnapshot, snapshot_hash) is not None:
+            return snapshot_hash
+        try:
+            missing = set(encoded_products)
+            hashes = list(missing)
+            for i in range(0, len(hashes), SNAPSHOT_LOOKUP_CHUNK):
+                chunk = hashes[i:i + SNAPSHOT_LOOKUP_CHUNK]
+                existing = db.session.query(ProductRecord.hash).filter(ProductRecord.hash.in_(chunk))
+                missing.difference_update(row[0] for row in existing)
+            for digest in missing:
+                db.session.add(ProductRecord(hash=digest, data=zlib.compress(encoded_products[digest], 6)))
+            db.session.add(ComparisonSnapshot(
+                hash=snapshot_hash,
+                payload=zlib.compress(document, 6),
+                product_count=len(product_hashes)
+            ))
+            db.session.commit()
+            return snapshot_hash
+        except IntegrityError:
+            # Someone stored the same content concurrently; look again
+            db.session.rollback()
+            if attempt:
+                raise
+    return snapshot_hash
+
+
+def load_comparison_snapshot(snapshot_hash: str) -> Optional[Dict[str, Any]]:
+    """Rebuild the comparison_data dict stored by store_comparison_snapshot."""
+    snapshot = db.session.get(ComparisonSnapshot, snapshot_hash)
+    if snapshot is None:
+        return None
+    document = json.loads(zlib.decompress(snapshot.payload))
     
-    if not shared_comp:
-        return render_template('error.html', 
-                             error_title='Comparison Not Found',
-                             error_message='This shared comparison does not exist or has been removed.'), 404
+    unique = list(set(document['products']))
+    records: Dict[str, Any] = {}
+    for i in range(0, len(unique), SNAPSHOT_LOOKUP_CHUNK):
+        chunk = unique[i:i + SNAPSHOT_LOOKUP_CHUNK]
+        for digest, data in db.session.query(ProductRecord.hash, ProductRecord.data).filter(ProductRecord.hash.in_(chunk)):
+            records[digest] = json.loads(zlib.decompress(data))
     
-    # Increment view count
-    shared_comp.view_count += 1
-    db.session.commit()
+    comparison_data = dict(document['meta'])
+    comparison_data['products'] = [records[digest] for digest in document['products'] if digest in records]
+    return comparison_data
+
+
+SHARE_PAGE_CACHE_TTL = int(os.environ.get('SHARE_PAGE_CACHE_TTL', '300'))
+SHARE_PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('SHARE_PAGE_CACHE_MAX_ENTRIES', '500'))
+# How long a cached page trusts its is_active flag before re-reading it (other workers may deactivate the link)
+SHARE_ACTIVE_CHECK_TTL = float(os.environ.get('SHARE_ACTIVE_CHECK_TTL', '5'))
+# Stands in for the view counter in cached pages, filled in per response
+SHARE_VIEWS_MARKER = '__SHARE_VIEWS__'
+
+share_page_cache = LRUCache(SHARE_PAGE_CACHE_MAX_ENTRIES)
+
+
+def format_views_note(view_count: int) -> str:
+    return f' • {view_count} views' if view_count > 1 else ''
+
+
+def get_shared_page(token: str) -> Optional[Dict[str, Any]]:
+    """
+    Rendered /share/<token> page. Shared comparisons never change after
+    creation, so the page is rendered once per process and kept for
+    SHARE_PAGE_CACHE_TTL seconds; only the view counter is filled in per hit.
+    The active flag is re-read at most every SHARE_ACTIVE_CHECK_TTL seconds,
+    so a link deactivated in another worker stops being served within that.
+    Returns None for unknown or deactivated links.
+    """
+    entry = share_page_cache.get(token)
+    now = time.time()
+    if entry is not None and now - entry[1] < SHARE_PAGE_CACHE_TTL:
+        page = entry[0]
+        if now - page['active_checked_at'] < SHARE_ACTIVE_CHECK_TTL:
+            return page
+        if db.session.query(SharedComparison.is_active).filter_by(id=page['id']).scalar():
+            page['active_checked_at'] = now
+            return page
+        share_page_cache.delete(token)
+        return None
+    
+    shared_comp = SharedComparison.query.filter_by(token=token, is_active=True).first()
+    if not shared_comp:
+        return None
     
     # Get the user who shared it
     owner = shared_comp.user
     
-    return render_template('shared_comparison.html', 
-                         comparison_data=shared_comp.comparison_data,
+    html = render_template('shared_comparison.html', 
+                         comparison_data=shared_comp.get_comparison_data(),
                          owner_email=owner.email,
-                         view_count=shared_comp.view_count,
+                         views_note=SHARE_VIEWS_MARKER,
                          created_at=shared_comp.created_at,
                          is_public=True)
+    head, _, tail = html.partition(SHARE_VIEWS_MARKER)
+    # Validator over the shared content only; the view counter is not part of it
+    content = shared_comp.snapshot_hash or content_hash(canonical_json(shared_comp.comparison_data))
+    page = {
+        'id': shared_comp.id,
+        'head': head,
+        'tail': tail,
+        'etag': hashlib.sha256(f'{token}:{content}'.encode()).hexdigest()[:32],
+        'last_modified': shared_comp.created_at,
+        'base_views': (shared_comp.view_count or 0) + share_views.pending(shared_comp.id),
+        'served': itertools.count(1),
+        'active_checked_at': time.time(),
+    }
+    share_page_cache.set(token, page)
+    return page
+
+
+@app.route('/share/<token>')
+def view_shared_comparison(token):
+    """Public view of a shared comparison (no login required)."""
+    page = get_shared_page(token)
+    
+    if not page:
+        return render_template('error.html', 
+                             error_title='Comparison Not Found',
+                             error_message='This shared comparison does not exist or has been removed.'), 404
+    
+    # Count the view; increments are buffered and flushed in batches
+    share_views.add(page['id'])
+    view_count = page['base_views'] + next(page['served'])
+    
+    # Weak ETag: the page is semantically unchanged between hits, so a client
+    # revalidating with it gets a 304 and may keep showing a stale view count
+    response = Response(page['head'] + format_views_note(view_count) + page['tail'], mimetype='text/html')
+    response.set_etag(page['etag'], weak=True)
+    response.last_modified = page['last_modified']
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response.make_conditional(request)
 
 
 # ============================
@@ -1292,11 +2696,38 @@ def view_shared_comparison(token):
 @app.route('/category_tree', methods=['GET'])
 @login_required
 def category_tree():
-    cats = load_categories()
-    # Filter out inactive categories
-    active_cats = [c for c in cats if c.get('is_active', True)]
-    tree = build_category_tree(active_cats)
-    return jsonify({'tree': tree})
+    # Prebuilt per taxonomy version (inactive categories filtered out); repeat visits get a 304
+    payload = get_taxonomy().active_tree_payload()
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = Response(payload['gzip'], mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(payload['etag'] + '-gz')
+    else:
+        response = Response(payload['body'], mimetype='application/json')
+        response.set_etag(payload['etag'])
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+CATEGORY_SEARCH_MAX_RESULTS = 200
+
+
+@app.route('/category_search', methods=['GET'])
+@login_required
+def category_search():
+    """
+    Typeahead over the active taxonomy.
+    Query: q, limit (default 20).
+    Returns {'results': [{id, name, path, path_ids, is_active}], 'total': number of matches before the limit}
+    """
+    q = request.args.get('q', '').strip()
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), CATEGORY_SEARCH_MAX_RESULTS))
+    except ValueError:
+        limit = 20
+    results, total = get_taxonomy().search_index().search_with_total(q, limit=limit)
+    return jsonify({'results': results, 'total': total})
 
 
 @app.route('/extract_nutrition_from_image', methods=['POST'])
@@ -1488,7 +2919,189 @@ Return JSON with these fields (use null if not found):
         return jsonify({'error': f'Failed to extract nutrition values: {str(e)}'}), 500
 
 
+# ============================
+# Product payload encoding
+# ============================
+# Per-product fields as built by collect_page_products, in output order
+PRODUCT_SCALAR_FIELDS = (
+    'id', 'name', 'ean', 'brand', 'current_price', 'current_unit_price', 'weight', 'weight_unit',
+    'image', 'url', 'updated_at'
+)
+PRODUCT_TAIL_FIELDS = ('ingredients', 'description', 'vendor')
+PRODUCT_FIELDS = frozenset(PRODUCT_SCALAR_FIELDS + ('nutrition', 'allergens', 'store', 'category_name') + PRODUCT_TAIL_FIELDS)
+PAYLOAD_FORMAT_COLUMNAR = b'C1'
+PAYLOAD_FORMAT_JSON = b'J1'
+
+
+class ValueDictionary:
+    """Assigns small integer codes to repeated values (stores, category paths, units)."""
+
+    def __init__(self):
+        self.values: List[Any] = []
+        self._codes: Dict[Any, int] = {}
+
+    def code(self, value) -> int:
+        key = (type(value).__name__, value)  # keep True and 1 apart
+        if key not in self._codes:
+            self._codes[key] = len(self.values)
+            self.values.append(value)
+        return self._codes[key]
+
+
+def is_columnar_product(product) -> bool:
+    if not isinstance(product, dict) or product.keys() != PRODUCT_FIELDS:
+        return False
+    nutrition, allergens = product['nutrition'], product['allergens']
+    if not isinstance(nutrition, dict) or not isinstance(allergens, dict):
+        return False
+    scalar = (str, int, float, bool, type(None))
+    return (
+        isinstance(product['store'], scalar)
+        and isinstance(product['category_name'], scalar)
+        and all(isinstance(v, scalar) for v in allergens.values())
+        and all(isinstance(v, dict) and v.keys() == {'amount', 'unit'} and isinstance(v['unit'], scalar)
+                for v in nutrition.values())
+    )
+
+
+def encode_product_payload(matrix: Dict[str, Any]) -> bytes:
+    """
+    Encode a product matrix compactly for ProductDataCache.
+
+    Products are stored column by column: stores, category paths, nutrient
+    units and allergen values are dictionary-encoded, and every nutrient in
+    `nutrition_codes` becomes one amount array (-1 unit code = not present).
+    The result is zlib compressed. Payloads whose products don't have the
+    find_products shape fall back to compressed plain JSON, so any dict
+    round-trips unchanged.
+    """
+    products = matrix.get('products') if isinstance(matrix, dict) else None
+    if not isinstance(products, list) or not all(is_columnar_product(p) for p in products):
+        return PAYLOAD_FORMAT_JSON + zlib.compress(json.dumps(matrix, separators=(',', ':')).encode('utf-8'))
+
+    stores, categories, units, allergen_values = ValueDictionary(), ValueDictionary(), ValueDictionary(), ValueDictionary()
+    nutrition_codes = sorted({code for p in products for code in p['nutrition']})
+    allergen_codes = sorted({code for p in products for code in p['allergens']})
+
+    columns = {field: [p[field] for p in products] for field in PRODUCT_SCALAR_FIELDS + PRODUCT_TAIL_FIELDS}
+    columns['store'] = [stores.code(p['store']) for p in products]
+    columns['category_name'] = [categories.code(p['category_name']) for p in products]
+
+    nutrition = {}
+    for code in nutrition_codes:
+        amounts, unit_codes = [], []
+        for p in products:
+            item = p['nutrition'].get(code)
+            amounts.append(item['amount'] if item else None)
+            unit_codes.append(units.code(item['unit']) if item else -1)
+        nutrition[code] = {'amount': amounts, 'unit': unit_codes}
+
+    allergens = {
+        code: [allergen_values.code(p['allergens'][code]) if code in p['allergens'] else -1 for p in products]
+        for code in allergen_codes
+    }
+
+    document = {
+        'meta': {k: v for k, v in matrix.items() if k != 'products'},
+        'count': len(products),
+        'stores': stores.values,
+        'categories': categories.values,
+        'units': units.values,
+        'allergen_values': allergen_values.values,
+        'columns': columns,
+        'nutrition': nutrition,
+        'allergens': allergens,
+    }
+    return PAYLOAD_FORMAT_COLUMNAR + zlib.compress(json.dumps(document, separators=(',', ':')).encode('utf-8'))
+
+
+def decode_product_payload(blob: bytes) -> Dict[str, Any]:
+    """Inverse of encode_product_payload."""
+    blob = bytes(blob)
+    body = json.loads(zlib.decompress(blob[2:]).decode('utf-8'))
+    if blob[:2] == PAYLOAD_FORMAT_JSON:
+        return body
+
+    columns, nutrition, allergens = body['columns'], body['nutrition'], body['allergens']
+    stores, categories, units, allergen_values = body['stores'], body['categories'], body['units'], body['allergen_values']
+    products = []
+    for i in range(body['count']):
+        product = {field: columns[field][i] for field in PRODUCT_SCALAR_FIELDS}
+        product['nutrition'] = {
+            code: {'amount': col['amount'][i], 'unit': units[col['unit'][i]]}
+            for code, col in nutrition.items() if col['unit'][i] >= 0
+        }
+        product['allergens'] = {
+            code: allergen_values[col[i]] for code, col in allergens.items() if col[i] >= 0
+        }
+        product['store'] = stores[columns['store'][i]]
+        product['category_name'] = categories[columns['category_name'][i]]
+        for field in PRODUCT_TAIL_FIELDS:
+            product[field] = columns[field][i]
+        products.append(product)
+
+    return {'products': products, **body['meta']}
+
+
+def compressed_json_response(payload, status: int = 200):
+    """jsonify(payload), gzip-compressed when the client accepts it and the body is large enough to benefit."""
+    response = jsonify(payload)
+    response.status_code = status
+    if 'gzip' in request.headers.get('Accept-Encoding', '') and response.content_length and response.content_length > 1024:
+        response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+    return response
+
+
 # Product data storage/retrieval using database (works across Railway instances)
+PRODUCT_DATA_TTL = int(os.environ.get('PRODUCT_DATA_TTL', '3600'))  # seconds
+PRODUCT_DATA_PURGE_BATCH = 500
+
+
+def product_data_cutoff() -> datetime:
+    """Entries created before this moment are expired."""
+    from datetime import timedelta
+    return datetime.utcnow() - timedelta(seconds=PRODUCT_DATA_TTL)
+
+
+def purge_expired_product_data(batch_size: int = PRODUCT_DATA_PURGE_BATCH) -> int:
+    """Delete expired ProductDataCache rows in small batches (uses the created_at index)."""
+    cutoff = product_data_cutoff()
+    deleted = 0
+    while True:
+        ids = [row.id for row in db.session.query(ProductDataCache.id)
+               .filter(ProductDataCache.created_at < cutoff)
+               .limit(batch_size).all()]
+        if not ids:
+            break
+        ProductDataCache.query.filter(ProductDataCache.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            break
+    if deleted:
+        print(f"[janitor] Purged {deleted} expired product data entries")
+    return deleted
+
+
+janitor.register(purge_expired_product_data)
+
+
+def store_product_data(user_id: int, payload: Dict[str, Any]) -> str:
+    """Save a product matrix in ProductDataCache and return its lookup key."""
+    # Expired entries are removed by the background janitor, not on this hot path
+    key = secrets.token_urlsafe(16)
+    cache_entry = ProductDataCache(
+        user_id=user_id,
+        cache_key=key
+    )
+    cache_entry.set_data(payload)
+    db.session.add(cache_entry)
+    db.session.commit()
+    return key
+
+
 @app.route('/set_product_data', methods=['POST'])
 @login_required
 def set_product_data():
@@ -1497,21 +3110,7 @@ def set_product_data():
         return jsonify({'error': 'Invalid payload'}), 400
     
     try:
-        # Clean up old cache entries (older than 1 hour)
-        from datetime import timedelta
-        one_hour_ago = datetime.utcnow() - timedelta(hours=1)
-        ProductDataCache.query.filter(ProductDataCache.created_at < one_hour_ago).delete()
-        
-        # Create new cache entry
-        key = secrets.token_urlsafe(16)
-        cache_entry = ProductDataCache(
-            user_id=current_user.id,
-            cache_key=key,
-            data=payload
-        )
-        db.session.add(cache_entry)
-        db.session.commit()
-        
+        key = store_product_data(current_user.id, payload)
         return jsonify({'ok': True, 'key': key})
     except Exception as e:
         db.session.rollback()
@@ -1528,21 +3127,586 @@ def get_product_data():
     
     try:
         # Find cache entry
-        cache_entry = ProductDataCache.query.filter_by(
-            cache_key=key,
-            user_id=current_user.id
+        cache_entry = ProductDataCache.query.filter(
+            ProductDataCache.cache_key == key,
+            ProductDataCache.user_id == current_user.id,
+            ProductDataCache.created_at >= product_data_cutoff()
         ).first()
         
         if not cache_entry:
             return jsonify({'error': 'Not found or expired'}), 404
         
-        return jsonify(cache_entry.data)
+        return compressed_json_response(cache_entry.get_data())
     except Exception as e:
         print(f"Error retrieving product data: {e}")
         return jsonify({'error': 'Failed to retrieve data'}), 500
 
 
+# Product set queries (server-side grouping/filtering/sorting for comparison.js)
+PRODUCT_SET_CACHE_MAX_ENTRIES = int(os.environ.get('PRODUCT_SET_CACHE_MAX_ENTRIES', '64'))
+PRODUCT_QUERY_PAGE_SIZE = 60
+PRODUCT_QUERY_MAX_PAGE_SIZE = 500
+PRODUCT_QUERY_SORTS = {'price_asc', 'price_desc', 'unit_price_asc', 'unit_price_desc', 'name_asc', 'name_desc'}
+# Nutrients shown in the comparison summary when the product set has them
+SUMMARY_NUTRITION_CODES = ['energi_kcal', 'fett_totalt', 'mettet_fett', 'umettet_fett', 'enumettet_fett',
+                           'flerumettet_fett', 'sukkerarter', 'protein', 'salt', 'kostfiber']
+IMAGE_HOST_BLOCKLIST = {'bilder.kolonial.no', 'api.vetduat.no'}
+
+product_set_cache = LRUCache(PRODUCT_SET_CACHE_MAX_ENTRIES)
+
+
+def is_finite_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def parse_int_param(value, name: str) -> int:
+    """Integer from client JSON (number or numeric string); raises ValueError otherwise."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f'{name} must be an integer')
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer') from None
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """ISO timestamp as an aware UTC datetime, or None."""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def months_ago(months: int) -> datetime:
+    now = datetime.now(timezone.utc)
+    index = now.year * 12 + now.month - 1 - months
+    year, month = divmod(index, 12)
+    day = min(now.day, calendar.monthrange(year, month + 1)[1])
+    return now.replace(year=year, month=month + 1, day=day)
+
+
+def is_valid_image_url(url) -> bool:
+    """Mirrors isValidHttpUrl in comparison.js."""
+    if not url or not isinstance(url, str) or url.isdigit():
+        return False
+    from urllib.parse import urlparse
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https'):
+        return not parsed.scheme and url.startswith('/')
+    return (parsed.hostname or '').lower() not in IMAGE_HOST_BLOCKLIST
+
+
+def count_nutrition_values(nutrition) -> int:
+    if not isinstance(nutrition, dict):
+        return 0
+    return sum(1 for n in nutrition.values()
+               if isinstance(n, dict) and is_finite_number(n.get('amount')) and n['amount'] > 0)
+
+
+def text_field(value) -> str:
+    """A free-text product field from stored client data, '' unless it is a string."""
+    return value if isinstance(value, str) else ''
+
+
+def load_product_set(key: str, user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Decoded product data for a comparison key, with per-product sort/filter
+    fields precomputed. Kept in a per-process LRU; entries are immutable, so
+    only ownership and expiry are re-checked.
+    """
+    entry = product_set_cache.get(key)
+    if entry is None:
+        cache_entry = ProductDataCache.query.filter(
+            ProductDataCache.cache_key == key,
+            ProductDataCache.created_at >= product_data_cutoff()
+        ).first()
+        if not cache_entry:
+            return None
+        matrix = cache_entry.get_data() or {}
+        products = matrix.get('products') or []
+        product_set = {
+            'user_id': cache_entry.user_id,
+            'created_at': cache_entry.created_at,
+            'meta': {k: v for k, v in matrix.items() if k != 'products'},
+            'products': products,
+            'search_text': [(text_field(p.get('name')).lower(), text_field(p.get('brand')).lower()) for p in products],
+            'updated_at': [parse_timestamp(p.get('updated_at')) for p in products],
+        }
+        product_set_cache.set(key, product_set)
+    else:
+        product_set = entry[0]
+    
+    if product_set['user_id'] != user_id or product_set['created_at'] < product_data_cutoff():
+        return None
+    return product_set
+
+
+def group_products_by_ean(products: List[Dict[str, Any]], updated_at: List[Optional[datetime]]) -> List[Dict[str, Any]]:
+    """
+    Same product (EAN) from several stores becomes one group with per-store
+    lowest prices, the most complete nutrition and the newest update time,
+    matching groupProductsByEAN in comparison.js.
+    """
+    groups: Dict[str, Dict[str, Any]] = {}
+    for p, p_updated in zip(products, updated_at):
+        ean = p.get('ean') or ''
+        if not ean or not isinstance(ean, (str, int)):
+            continue
+        g = groups.get(ean)
+        if g is None:
+            g = groups[ean] = {
+                'key': f'ean:{ean}',
+                'ean': ean,
+                'name': text_field(p.get('name')) or None,
+                'brand': p.get('brand') or None,
+                'image': None,
+                'nutrition': {},
+                'nutrition_count': 0,
+                'allergens': p.get('allergens') or None,
+                'updated_at': p.get('updated_at') or None,
+                'updated_ts': p_updated,
+                'stores': {},
+                'ids': {},
+            }
+        if not g['name'] and text_field(p.get('name')):
+            g['name'] = p['name']
+        if not g['image'] and is_valid_image_url(p.get('image')):
+            g['image'] = p['image']
+        if not g['brand'] and p.get('brand'):
+            g['brand'] = p['brand']
+        if p_updated and (g['updated_ts'] is None or p_updated > g['updated_ts']):
+            g['updated_at'], g['updated_ts'] = p.get('updated_at'), p_updated
+        
+        # Prefer the variant with the most complete nutrition data
+        if p.get('nutrition'):
+            count = count_nutrition_values(p['nutrition'])
+            if count > g['nutrition_count']:
+                g['nutrition'], g['nutrition_count'] = p['nutrition'], count
+        if not g['allergens'] and p.get('allergens'):
+            g['allergens'] = p['allergens']
+        
+        # Keep the lowest price/unit price seen for each store
+        store_name = p.get('store') or 'Unknown'
+        store = g['stores'].get(store_name)
+        if store is None:
+            store = g['stores'][store_name] = {
+                'store': store_name, 'price': None, 'unit_price': None,
+                'weight_unit': p.get('weight_unit') or None, 'url': p.get('url') or None,
+            }
+        price, unit_price = p.get('current_price'), p.get('current_unit_price')
+        if is_finite_number(price) and (not is_finite_number(store['price']) or price < store['price']):
+            store['price'] = price
+        if is_finite_number(unit_price) and (not is_finite_number(store['unit_price']) or unit_price < store['unit_price']):
+            store['unit_price'] = unit_price
+            store['weight_unit'] = p.get('weight_unit') or store['weight_unit']
+        if not store['url'] and p.get('url'):
+            store['url'] = p['url']
+        if p.get('id'):
+            g['ids'][p['id']] = True
+    
+    result = []
+    for g in groups.values():
+        stores = list(g['stores'].values())
+        prices = [st['price'] for st in stores if st['price']]
+        unit_prices = [st['unit_price'] for st in stores if st['unit_price']]
+        result.append({
+            'key': g['key'],
+            'ean': g['ean'],
+            'name': g['name'],
+            'brand': g['brand'],
+            'image': g['image'],
+            'nutrition': g['nutrition'],
+            'allergens': g['allergens'],
+            'updated_at': g['updated_at'],
+            'stores': stores,
+            'ids': list(g['ids']),
+            'min_price': min(prices) if prices else None,
+            'min_unit_price': min(unit_prices) if unit_prices else None,
+        })
+    return result
+
+
+def sort_product_groups(groups: List[Dict[str, Any]], sort_by: str) -> None:
+    """Sort groups in place; groups without a price always go last."""
+    if sort_by in ('name_asc', 'name_desc'):
+        groups.sort(key=lambda g: text_field(g['name']).casefold(), reverse=sort_by == 'name_desc')
+        return
+    field = 'min_unit_price' if sort_by.startswith('unit_price') else 'min_price'
+    descending = sort_by.endswith('_desc')
+    groups.sort(key=lambda g: (g[field] is None, -g[field] if descending and g[field] is not None else (g[field] or 0)))
+
+
+class NutritionMatrix:
+    """
+    Nutrition of a set of products (or EAN groups) as a dense rows × codes
+    float array. Each code keeps only amounts in its dominant unit, the rest
+    are NaN and `mask` marks the values present, so statistics over any subset
+    of rows are single NumPy reductions across all codes at once.
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]], codes: List[str]):
+        self.codes = list(codes)
+        column = {code: j for j, code in enumerate(self.codes)}
+        unit_ids: Dict[str, int] = {}
+        row_idx, col_idx, unit_idx, amounts = [], [], [], []
+        for i, row in enumerate(rows):
+            nutrition = row.get('nutrition')
+            for code, n in (nutrition.items() if isinstance(nutrition, dict) else ()):
+                j = column.get(code)
+                if j is None or not isinstance(n, dict) or not is_finite_number(n.get('amount')):
+                    continue
+                row_idx.append(i)
+                col_idx.append(j)
+                unit_idx.append(unit_ids.setdefault(n.get('unit') or '', len(unit_ids)))
+                amounts.append(n['amount'])
+        
+        rows_a, cols_a, units_a = (np.asarray(a, dtype=np.intp) for a in (row_idx, col_idx, unit_idx))
+        # Dominant unit per code (ties go to the unit seen first)
+        unit_counts = np.zeros((len(self.codes), max(len(unit_ids), 1)), dtype=np.int64)
+        np.add.at(unit_counts, (cols_a, units_a), 1)
+        dominant = unit_counts.argmax(axis=1)
+        keep = units_a == dominant[cols_a]
+        
+        self.values = np.full((len(rows), len(self.codes)), np.nan)
+        self.values[rows_a[keep], cols_a[keep]] = np.asarray(amounts, dtype=float)[keep]
+        self.mask = ~np.isnan(self.values)
+        unit_names = list(unit_ids)
+        self.units = [unit_names[u] if unit_counts[j, u] else None for j, u in enumerate(dominant)]
+
+    def reference_vector(self, nutrition: Optional[Dict[str, Any]]) -> np.ndarray:
+        """A product's nutrition aligned to the codes; amounts in another unit are left out."""
+        ref = np.full(len(self.codes), np.nan)
+        for j, code in enumerate(self.codes):
+            n = (nutrition or {}).get(code)
+            if isinstance(n, dict) and is_finite_number(n.get('amount')) and \
+                    (not n.get('unit') or not self.units[j] or n['unit'] == self.units[j]):
+                ref[j] = n['amount']
+        return ref
+
+    def _describe(self, values: np.ndarray, percentiles, reference: Optional[np.ndarray]) -> Dict[str, Any]:
+        rows = len(values)
+        counts = (~np.isnan(values)).sum(axis=0)
+        if not rows:
+            values = np.full((1, len(self.codes)), np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN columns just give NaN
+            mean = np.nanmean(values, axis=0)
+            points = np.nanpercentile(values, [50, *percentiles], axis=0) if values.size else \
+                np.empty((len(percentiles) + 1, 0))
+        result = {
+            'rows': rows,
+            'count': counts.tolist(),
+            'unit': self.units,
+            'mean': mean,
+            'median': points[0],
+        }
+        for p, row in zip(percentiles, points[1:]):
+            result[f'p{p:g}'] = row
+        if reference is not None:
+            delta = mean - reference
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result['delta'] = delta
+                result['delta_pct'] = np.where(reference != 0, delta / reference * 100, np.nan)
+        # JSON-friendly: NaN becomes None
+        return {k: [None if isinstance(x, float) and math.isnan(x) else x for x in v.tolist()]
+                if isinstance(v, np.ndarray) else v for k, v in result.items()}
+
+    def stats(self, labels: Optional[List[Any]] = None, percentiles=(25, 75),
+              reference: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Count, mean, median and percentiles per code over all rows, and per
+        label (store, category, ...) when labels are given; with a reference
+        product, also the difference of each mean to it (absolute and %).
+        """
+        ref = self.reference_vector(reference) if reference is not None else None
+        result = {'codes': self.codes, 'overall': self._describe(self.values, percentiles, ref), 'groups': []}
+        if labels is not None and len(labels):
+            # Sort rows by label once; each group is then a contiguous slice
+            keys, inverse = np.unique(np.asarray([str(label or '') for label in labels]), return_inverse=True)
+            order = np.argsort(inverse, kind='stable')
+            bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+            for g, key in enumerate(keys):
+                group = self._describe(self.values[order[bounds[g]:bounds[g + 1]]], percentiles, ref)
+                result['groups'].append({'label': str(key), **group})
+        return result
+
+
+def summarize_product_groups(groups: List[Dict[str, Any]], nutrition_codes: List[str]) -> Dict[str, Any]:
+    """
+    Figures for the comparison summary panel: average lowest price and unit
+    price, and per nutrient the average over groups in the dominant unit.
+    """
+    prices = [g['min_price'] for g in groups if is_finite_number(g['min_price'])]
+    unit_prices = [g['min_unit_price'] for g in groups if is_finite_number(g['min_unit_price'])]
+    codes = [c for c in SUMMARY_NUTRITION_CODES if c in nutrition_codes] or list(nutrition_codes)[:5]
+    
+    stats = NutritionMatrix(groups, codes).stats()['overall']
+    nutrition = [
+        {'code': code, 'amount': stats['mean'][j], 'median': stats['median'][j],
+         'unit': stats['unit'][j], 'count': stats['count'][j]}
+        for j, code in enumerate(codes) if stats['count'][j]
+    ]
+    
+    return {
+        'count': len(groups),
+        'avg_price': sum(prices) / len(prices) if prices else None,
+        'avg_unit_price': sum(unit_prices) / len(unit_prices) if unit_prices else None,
+        'nutrition': nutrition,
+    }
+
+
+def parse_product_filters(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    search / updated_within_months / exclude_eans from a product set request,
+    as keyword arguments for filter_products. Raises ValueError on bad input.
+    """
+    search = data.get('search') or ''
+    if not isinstance(search, str):
+        raise ValueError('search must be a string')
+    
+    months = data.get('updated_within_months')
+    if months in (None, '', 'all'):
+        months = None
+    else:
+        months = parse_int_param(months, 'updated_within_months')
+        if months < 0:
+            raise ValueError('updated_within_months must not be negative')
+    
+    exclude_eans = data.get('exclude_eans') or []
+    if not isinstance(exclude_eans, list) or \
+            any(isinstance(ean, bool) or not isinstance(ean, (str, int)) for ean in exclude_eans):
+        raise ValueError('exclude_eans must be a list of EANs')
+    
+    return {'search': search, 'updated_within_months': months, 'exclude_eans': [str(ean) for ean in exclude_eans]}
+
+
+def filter_products(product_set: Dict[str, Any], search: str = '', updated_within_months: Optional[int] = None,
+                    exclude_eans=()) -> tuple:
+    """Products (and their parsed updated_at) matching the search/date filters, minus excluded EANs."""
+    search = (search or '').lower()
+    cutoff = months_ago(updated_within_months) if updated_within_months is not None else None
+    excluded = set(exclude_eans or ())
+    
+    selected, selected_updated = [], []
+    for p, (name, brand), p_updated in zip(product_set['products'], product_set['search_text'], product_set['updated_at']):
+        if search and search not in name and search not in brand:
+            continue
+        if cutoff is not None and (p_updated is None or p_updated < cutoff):
+            continue
+        if excluded and p.get('ean') in excluded:
+            continue
+        selected.append(p)
+        selected_updated.append(p_updated)
+    return selected, selected_updated
+
+
+def query_product_groups(product_set: Dict[str, Any], search: str = '', updated_within_months: Optional[int] = None,
+                         hide_no_nutrition: bool = False, exclude_eans=(), sort_by: str = 'price_asc') -> List[Dict[str, Any]]:
+    """Filter the products, group them by EAN, drop empty groups and sort."""
+    selected, selected_updated = filter_products(product_set, search, updated_within_months, exclude_eans)
+    groups = group_products_by_ean(selected, selected_updated)
+    if hide_no_nutrition:
+        groups = [g for g in groups if any(v not in (None, '') for v in (g['nutrition'] or {}).values())]
+    sort_product_groups(groups, sort_by if sort_by in PRODUCT_QUERY_SORTS else 'price_asc')
+    return groups
+
+
+@app.route('/product_data/query', methods=['POST'])
+@login_required
+def query_product_data():
+    """
+    One page of the stored product set for a comparison key, grouped by EAN,
+    filtered and sorted on the server.
+    JSON: {key, search?, sort_by?, updated_within_months?, hide_no_nutrition?,
+           exclude_eans?, page?, page_size?, include_meta?}
+    Returns {groups, page, page_size, pages, total_groups, total_products, summary, meta?}
+    """
+    data = request.get_json(silent=True) or {}
+    key = data.get('key')
+    if not key:
+        return jsonify({'error': 'Missing key'}), 400
+    
+    try:
+        page = max(1, parse_int_param(data.get('page') or 1, 'page'))
+        page_size = max(1, min(parse_int_param(data.get('page_size') or PRODUCT_QUERY_PAGE_SIZE, 'page_size'),
+                               PRODUCT_QUERY_MAX_PAGE_SIZE))
+        filters = parse_product_filters(data)
+        sort_by = data.get('sort_by') or 'price_asc'
+        if not isinstance(sort_by, str):
+            raise ValueError('sort_by must be a string')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    product_set = load_product_set(key, current_user.id)
+    if product_set is None:
+        return jsonify({'error': 'Not found or expired'}), 404
+    
+    groups = query_product_groups(
+        product_set,
+        hide_no_nutrition=bool(data.get('hide_no_nutrition')),
+        sort_by=sort_by,
+        **filters
+    )
+    pages = max(1, math.ceil(len(groups) / page_size))
+    page = min(page, pages)
+    
+    result = {
+        'groups': groups[(page - 1) * page_size:page * page_size],
+        'page': page,
+        'page_size': page_size,
+        'pages': pages,
+        'total_groups': len(groups),
+        'total_products': len(product_set['products']),
+        'summary': summarize_product_groups(groups, product_set['meta'].get('nutrition_codes') or []),
+    }
+    if data.get('include_meta'):
+        result['meta'] = product_set['meta']
+    return compressed_json_response(result)
+
+
+PRODUCT_STATS_GROUPINGS = {'store': 'store', 'category': 'category_name'}
+
+
+@app.route('/product_data/stats', methods=['POST'])
+@login_required
+def product_data_stats():
+    """
+    Nutrition statistics for the stored product set of a comparison key, per
+    store or category listing, with deltas against the user's product.
+    JSON: {key, by? ('store' | 'category'), codes?, percentiles?, search?,
+           updated_within_months?, exclude_eans?}
+    Returns {codes, overall: {rows, count, unit, mean, median, p25, p75, delta?, delta_pct?}, groups: [...]}
+    where every per-code field is a list aligned with codes.
+    """
+    data = request.get_json(silent=True) or {}
+    key = data.get('key')
+    if not key:
+        return jsonify({'error': 'Missing key'}), 400
+    by = data.get('by')
+    if by is not None and by not in PRODUCT_STATS_GROUPINGS:
+        return jsonify({'error': f"by must be one of {', '.join(sorted(PRODUCT_STATS_GROUPINGS))}"}), 400
+    
+    percentiles = data.get('percentiles') or [25, 75]
+    if not isinstance(percentiles, list) or not all(is_finite_number(p) and 0 <= p <= 100 for p in percentiles):
+        return jsonify({'error': 'percentiles must be a list of numbers between 0 and 100'}), 400
+    codes = data.get('codes')
+    if codes is not None and (not isinstance(codes, list) or not all(isinstance(c, str) for c in codes)):
+        return jsonify({'error': 'codes must be a list of nutrition codes'}), 400
+    try:
+        filters = parse_product_filters(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    product_set = load_product_set(key, current_user.id)
+    if product_set is None:
+        return jsonify({'error': 'Not found or expired'}), 404
+    
+    meta = product_set['meta']
+    available = meta.get('nutrition_codes') or []
+    if codes:
+        known = set(available)
+        codes = [c for c in dict.fromkeys(codes) if c in known]
+    else:
+        codes = available
+    products, _ = filter_products(product_set, **filters)
+    labels = [p.get(PRODUCT_STATS_GROUPINGS[by]) for p in products] if by else None
+    user_product = meta.get('user_product') or {}
+    
+    stats = NutritionMatrix(products, codes).stats(
+        labels=labels,
+        percentiles=percentiles,
+        reference=user_product.get('nutrition') if user_product else None
+    )
+    return compressed_json_response(stats)
+
+
 # Product search and comparison
+PRODUCT_STREAM_FORMATS = {'application/x-ndjson': 'ndjson', 'text/event-stream': 'sse'}
+
+
+def format_stream_frame(stream_format: str, frame_type: str, payload: Dict[str, Any]) -> str:
+    """Encode one frame of a streamed find_products response as NDJSON or SSE."""
+    if stream_format == 'sse':
+        return f"event: {frame_type}\ndata: {json.dumps(payload)}\n\n"
+    return json.dumps({'type': frame_type, **payload}) + '\n'
+
+
+def collect_page_products(page_body: Dict[str, Any], origin_name: Optional[str], nutrition_unit: str,
+                          seen_products: set) -> List[Dict[str, Any]]:
+    """
+    Turn one Kassal listing page into comparison products, skipping (EAN, store)
+    combinations already in `seen_products` and products of another weight unit.
+    """
+    result = []
+    for product in page_body.get('data', []):
+        ean = product.get('ean')
+
+        # Get store info - API returns store as a single object (not array)
+        store = product.get('store')
+        if store and isinstance(store, dict):
+            store_name = store.get('name', 'Unknown')
+        else:
+            store_name = 'Unknown'
+
+        # Create unique key combining EAN and store to allow same product from different stores
+        # If no EAN, use product ID to ensure uniqueness
+        if ean:
+            product_key = (ean, store_name)
+        else:
+            # Products without EAN are considered unique (use ID)
+            product_key = (product.get('id'), store_name)
+
+        if product_key in seen_products:
+            continue
+        seen_products.add(product_key)
+
+        # Filter by nutrition unit - only include products with matching weight_unit
+        product_weight_unit = product.get('weight_unit', '')
+        if product_weight_unit != nutrition_unit:
+            continue  # Skip products that don't match the selected unit
+
+        # Get category info
+        categories = product.get('category') or []
+        category_names = [c.get('name') for c in categories if c.get('name')]
+        category_path = ' > '.join(category_names) if category_names else origin_name
+
+        result.append({
+            'id': product['id'],
+            'name': product['name'],
+            'ean': ean,
+            'brand': product.get('brand'),
+            'current_price': product.get('current_price'),
+            'current_unit_price': product.get('current_unit_price'),
+            'weight': product.get('weight'),
+            'weight_unit': product.get('weight_unit'),
+            'image': product.get('image'),
+            'url': product.get('url'),
+            'updated_at': product.get('updated_at'),  # Add last updated date
+            'nutrition': {
+                item['code']: {
+                    'amount': item['amount'],
+                    'unit': item['unit']
+                }
+                for item in product.get('nutrition') or []
+            },
+            'allergens': {
+                item['code']: item['contains']
+                for item in product.get('allergens') or []
+            },
+            'store': store_name,
+            'category_name': category_path,
+            'ingredients': product.get('ingredients'),
+            'description': product.get('description'),
+            'vendor': product.get('vendor')
+        })
+    return result
+
+
 @app.route('/find_products', methods=['POST'])
 @login_required
 def find_products():
@@ -1564,213 +3728,260 @@ def find_products():
     if not selected_categories:
         return jsonify({'error': 'No categories selected'}), 400
     
-    # Check usage limits based on mode
+    # Check and count usage limits based on mode (one conditional UPDATE)
     if mode == 'explore':
-        if not current_user.can_explore():
-            remaining = current_user.get_remaining_explores()
-            if current_user.is_subscribed():
-                return jsonify({'error': 'Unable to process request'}), 403
-            else:
-                return jsonify({
-                    'error': 'Daily explore limit reached',
-                    'message': f'Free users can explore 3 times per day. You have used all your explores for today. Upgrade to Premium for unlimited access!',
-                    'remaining': remaining
-                }), 429
-        
-        # Increment explore count
-        current_user.increment_explore_count()
+        if not current_user.consume_daily_quota('explore'):
+            return jsonify({
+                'error': 'Daily explore limit reached',
+                'message': f'Free users can explore 3 times per day. You have used all your explores for today. Upgrade to Premium for unlimited access!',
+                'remaining': current_user.get_remaining_explores()
+            }), 429
     elif mode == 'compare':
-        if not current_user.can_compare():
-            remaining = current_user.get_remaining_compares()
-            if current_user.is_subscribed():
-                return jsonify({'error': 'Unable to process request'}), 403
-            else:
-                return jsonify({
-                    'error': 'Daily compare limit reached',
-                    'message': f'Free users can compare 1 time per day. You have used your compare for today. Upgrade to Premium for unlimited access!',
-                    'remaining': remaining
-                }), 429
-        
-        # Increment compare count
-        current_user.increment_compare_count()
-
-    # Parameters for pagination and rate limiting
-    page_size = 100  # Max allowed by API
-    rate_limit = 60  # requests per minute
-    rate_window = 60  # seconds
-    request_timestamps = []
-    
-    # API headers
-    headers = {
-        'Authorization': f'Bearer {api_token}',
-        'Accept': 'application/json'
-    }
+        if not current_user.consume_daily_quota('compare'):
+            return jsonify({
+                'error': 'Daily compare limit reached',
+                'message': f'Free users can compare 1 time per day. You have used your compare for today. Upgrade to Premium for unlimited access!',
+                'remaining': current_user.get_remaining_compares()
+            }), 429
 
     all_products = []
     seen_products = set()  # To avoid duplicates by (EAN, store) combination
 
     # Expand selected categories to leaf category ids (so non-leaf selections include all sub-leaf categories)
-    cats_flat = load_categories()
+    taxonomy = get_taxonomy()
     expanded_category_ids: Dict[str, str] = {}  # leaf_id -> pretty name path (best effort)
     for category in selected_categories:
         cid = str(category['id'])
-        leaf_ids = get_leaf_descendants(cats_flat, cid)
+        leaf_ids = taxonomy.leaf_descendants(cid)
         # if nothing returned (unknown id), just include original id
         if not leaf_ids:
             leaf_ids = [cid]
         # try to compute a readable name for the group origin (fallback to provided name)
-        origin_name = category.get('name') or find_category_path(cats_flat, cid) or str(cid)
+        origin_name = category.get('name') or taxonomy.path(cid) or str(cid)
         for lid in leaf_ids:
             expanded_category_ids[lid] = origin_name
 
     leaf_id_list = list(expanded_category_ids.keys())
+    for lid in leaf_id_list:
+        category_demand.add(lid)
 
-    # Process each (leaf) category id
-    for category_id in leaf_id_list:
-        page = 1
-        
-        while True:
-            # Rate limiting
-            now = time.time()
-            request_timestamps = [ts for ts in request_timestamps if now - ts < rate_window]
-            if len(request_timestamps) >= rate_limit:
-                sleep_time = rate_window - (now - request_timestamps[0])
-                if sleep_time > 0:
-                    time.sleep(sleep_time)
-            
-            # Make API request
-            try:
-                params = {
-                    'category_id': int(category_id),  # API expects integer
-                    'size': page_size,
-                    'page': page
-                }
-                # Print the fully resolved GET URL for troubleshooting (copyable into Postman)
-                prepared = requests.Request(
-                    'GET', 'https://kassal.app/api/v1/products', params=params
-                ).prepare()
-                print(f"[GET] {prepared.url}")
-
-                response = requests.get(
-                    'https://kassal.app/api/v1/products',
-                    headers=headers,
-                    params=params
-                )
-                request_timestamps.append(time.time())
-                
-                if response.status_code != 200:
-                    print(f"API error for category {category_id}: {response.status_code}")
-                    break
+    # Categories as shown on the comparison page
+    category_labels = [c.get('name') or taxonomy.path(c.get('id')) or str(c.get('id')) for c in selected_categories]
 
-                data = response.json()
-                products = data.get('data', [])
-                links = data.get('links', {})
-                
-                # Add current page products (including last page)
-                for product in products:
-                    ean = product.get('ean')
-                    
-                    # Get store info - API returns store as a single object (not array)
-                    store = product.get('store')
-                    if store and isinstance(store, dict):
-                        store_name = store.get('name', 'Unknown')
-                    else:
-                        store_name = 'Unknown'
-                    
-                    # Create unique key combining EAN and store to allow same product from different stores
-                    # If no EAN, use product ID to ensure uniqueness
-                    if ean:
-                        product_key = (ean, store_name)
-                    else:
-                        # Products without EAN are considered unique (use ID)
-                        product_key = (product.get('id'), store_name)
-                    
-                    if product_key not in seen_products:
-                        seen_products.add(product_key)
-                        
-                        # Filter by nutrition unit - only include products with matching weight_unit
-                        product_weight_unit = product.get('weight_unit', '')
-                        if product_weight_unit != nutrition_unit:
-                            continue  # Skip products that don't match the selected unit
-                        
-                        # Get category info
-                        categories = product.get('category', [])
-                        category_names = [c.get('name') for c in categories if c.get('name')]
-                        origin_name = expanded_category_ids.get(str(category_id))
-                        category_path = ' > '.join(category_names) if category_names else origin_name
-                        
-                        all_products.append({
-                            'id': product['id'],
-                            'name': product['name'],
-                            'ean': ean,
-                            'brand': product.get('brand'),
-                            'current_price': product.get('current_price'),
-                            'current_unit_price': product.get('current_unit_price'),
-                            'weight': product.get('weight'),
-                            'weight_unit': product.get('weight_unit'),
-                            'image': product.get('image'),
-                            'url': product.get('url'),
-                            'updated_at': product.get('updated_at'),  # Add last updated date
-                            'nutrition': {
-                                item['code']: {
-                                    'amount': item['amount'],
-                                    'unit': item['unit']
-                                }
-                                for item in product.get('nutrition', [])
-                            },
-                            'allergens': {
-                                item['code']: item['contains']
-                                for item in product.get('allergens', [])
-                            },
-                            'store': store_name,
-                            'category_name': category_path,
-                            'ingredients': product.get('ingredients'),
-                            'description': product.get('description'),
-                            'vendor': product.get('vendor')
-                        })
-
-                # Stop if no more products or no next page
-                links = data.get('links', {})
-                if not products or not links.get('next'):
-                    break
-                    
-                page += 1
+    def summary_fields(nutrition_codes, allergen_codes, stores) -> Dict[str, Any]:
+        return {
+            'nutrition_codes': sorted(set(nutrition_codes)),
+            'allergen_codes': sorted(set(allergen_codes)),
+            'stores': sorted(set(stores)),
+            'categories': category_labels,
+            'selected_categories': selected_categories,  # Keep original structure with IDs for saving
+            'user_product': user_product,
+            'nutrition_unit': nutrition_unit,  # Pass the selected unit to the comparison page
+            'timestamp': datetime.now().isoformat()
+        }
 
-            except Exception as e:
-                print(f"Error fetching products for category {category_id}: {e}")
-                break
+    stream_format = PRODUCT_STREAM_FORMATS.get(
+        request.accept_mimetypes.best_match(['application/json', *PRODUCT_STREAM_FORMATS])
+    ) or ('ndjson' if data.get('stream') else None)
+    if stream_format:
+        def generate():
+            nutrition_codes, allergen_codes, stores = set(), set(), set()
+            product_count = 0
+            for category_id, page_body in kassal_engine.stream_categories(api_token, leaf_id_list):
+                products = collect_page_products(
+                    page_body, expanded_category_ids.get(str(category_id)), nutrition_unit, seen_products
+                )
+                if not products:
+                    continue
+                product_count += len(products)
+                for p in products:
+                    nutrition_codes.update(p['nutrition'].keys())
+                    allergen_codes.update(p['allergens'].keys())
+                    if p['store']:
+                        stores.add(p['store'])
+                yield format_stream_frame(stream_format, 'products', {
+                    'category_id': category_id,
+                    'products': products
+                })
+            summary = summary_fields(nutrition_codes, allergen_codes, stores)
+            summary['product_count'] = product_count
+            print(f"Streamed {product_count} unique products across {len(leaf_id_list)} leaf categories (from {len(selected_categories)} selections).")
+            yield format_stream_frame(stream_format, 'summary', summary)
+
+        mimetype = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+        return Response(stream_with_context(generate()), mimetype=mimetype, headers={'X-Accel-Buffering': 'no'})
+
+    # Fetch every (leaf) category and its pages concurrently within the shared rate limit
+    listings = kassal_engine.run(kassal_engine.fetch_categories(api_token, leaf_id_list))
+
+    # Process each (leaf) category id in selection order so de-duplication stays deterministic
+    for category_id in leaf_id_list:
+        for page_body in listings.get(category_id, []):
+            all_products.extend(collect_page_products(
+                page_body, expanded_category_ids.get(str(category_id)), nutrition_unit, seen_products
+            ))
 
     # Group products by relevant properties for comparison
     product_matrix = {
         'products': all_products,
-        'nutrition_codes': sorted(set(
-            code
-            for p in all_products
-            for code in p['nutrition'].keys()
-        )),
-        'allergen_codes': sorted(set(
-            code
-            for p in all_products
-            for code in p['allergens'].keys()
-        )),
-        'stores': sorted(set(
-            p['store'] for p in all_products if p['store']
-        )),
-        'categories': [c.get('name') or find_category_path(cats_flat, c.get('id')) or str(c.get('id')) for c in selected_categories],
-        'selected_categories': selected_categories,  # Keep original structure with IDs for saving
-        'user_product': user_product,
-        'nutrition_unit': nutrition_unit,  # Pass the selected unit to the comparison page
-        'timestamp': datetime.now().isoformat()
+        **summary_fields(
+            (code for p in all_products for code in p['nutrition'].keys()),
+            (code for p in all_products for code in p['allergens'].keys()),
+            (p['store'] for p in all_products if p['store'])
+        )
     }
     print(f"Found {len(all_products)} unique products across {len(leaf_id_list)} leaf categories (from {len(selected_categories)} selections).")
 
+    # Keep the matrix server-side and hand back only the key for /comparison?key=...
+    if data.get('persist'):
+        try:
+            key = store_product_data(current_user.id, product_matrix)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error storing product data: {e}")
+            return jsonify({'error': 'Failed to store data'}), 500
+        return jsonify({'ok': True, 'key': key, 'product_count': len(all_products)})
+
     return jsonify(product_matrix)
 
 
 # Price history endpoint: fetches price development per store for given product IDs
+PRICE_HISTORY_REFRESH_INTERVAL = int(os.environ.get('PRICE_HISTORY_REFRESH_INTERVAL', '21600'))  # seconds
+
+
+def extract_price_points(body: Any) -> List[tuple]:
+    """Pull (store, date, price) points out of a Kassal product response."""
+    points = []
+    # Try common shapes to find price history
+    product = body.get('data') if isinstance(body, dict) else None
+    if not product:
+        product = body if isinstance(body, dict) else None
+
+    # Get store name from root when history items lack it
+    store_name_root = None
+    try:
+        s = product.get('store') if isinstance(product, dict) else None
+        if isinstance(s, dict):
+            store_name_root = s.get('name') or s.get('store')
+        elif isinstance(s, str):
+            store_name_root = s
+    except Exception:
+        store_name_root = None
+
+    history_lists = []
+    if product:
+        if isinstance(product.get('prices'), list):
+            history_lists.append(product['prices'])
+        if isinstance(product.get('price_history'), list):
+            history_lists.append(product['price_history'])
+        if isinstance(product.get('priceHistory'), list):
+            history_lists.append(product['priceHistory'])
+
+    for hist in history_lists:
+        for item in hist:
+            price = item.get('price') or item.get('amount') or item.get('value')
+            dt = item.get('date') or item.get('created_at') or item.get('updated_at') or item.get('timestamp')
+            # Extract store name
+            store_obj = item.get('store') if isinstance(item, dict) else None
+            store_name = None
+            if isinstance(store_obj, dict):
+                store_name = store_obj.get('name') or store_obj.get('store')
+            if not store_name:
+                store_name = item.get('store') if isinstance(item, dict) else None
+            if not store_name:
+                store_name = store_name_root
+            if store_name and price is not None and dt:
+                points.append((store_name, str(dt)[:10], float(price)))
+    return points
+
+
+async def fetch_price_points(api_token: str, pid) -> Optional[List[tuple]]:
+    """Price points for one product from upstream. None when the fetch failed."""
+    try:
+        body = await kassal_engine.get_json(api_token, f'/products/{pid}')
+        if body is None:
+            return None
+        points = extract_price_points(body)
+    except Exception as e:
+        print(f"Error fetching price history for product {pid}: {e}")
+        return None
+    return points
+
+
+async def fetch_price_points_many(api_token: str, product_ids: list) -> List[Optional[List[tuple]]]:
+    """Fetch price points for many products concurrently, in input order."""
+    semaphore = asyncio.Semaphore(KASSAL_MAX_CONCURRENCY)
+
+    async def bounded(pid):
+        async with semaphore:
+            return await fetch_price_points(api_token, pid)
+
+    return await asyncio.gather(*(bounded(pid) for pid in product_ids))
+
+
+def store_price_points(product_id: str, points: List[tuple], sync: Optional[PriceHistorySync]) -> None:
+    """
+    Merge freshly fetched points into the local store. Only points on or after
+    the latest stored date are written; older history is already on disk.
+    """
+    latest = sync.latest_date if sync else None
+    collapsed: Dict[tuple, float] = {}
+    for store_name, day, price in points:
+        try:
+            day = datetime.strptime(day, '%Y-%m-%d').date()
+        except ValueError:
+            continue
+        if latest is None or day >= latest:
+            collapsed[(store_name, day)] = price  # last value per store/date wins
+
+    if collapsed:
+        if latest is not None:
+            # The latest day may have been re-priced since the last refresh
+            PricePoint.query.filter(
+                PricePoint.product_id == product_id,
+                PricePoint.date >= latest
+            ).delete(synchronize_session=False)
+        db.session.add_all([
+            PricePoint(product_id=product_id, store=store_name, date=day, price=price)
+            for (store_name, day), price in collapsed.items()
+        ])
+        latest = max([day for _, day in collapsed] + ([latest] if latest else []))
+
+    if sync is None:
+        sync = PriceHistorySync(product_id=product_id)
+        db.session.add(sync)
+    sync.latest_date = latest
+    sync.refreshed_at = datetime.utcnow()
+
+
+def load_price_series(product_ids: List[str]) -> Dict[str, list]:
+    """Per-store series for the given products, read from the local price_points table."""
+    rows = PricePoint.query.filter(PricePoint.product_id.in_(product_ids)).order_by(PricePoint.date).all()
+    by_product: Dict[str, list] = defaultdict(list)
+    for row in rows:
+        by_product[row.product_id].append(row)
+
+    series: Dict[str, list] = {}
+    for pid in product_ids:
+        for row in by_product.get(pid, []):
+            series.setdefault(row.store, []).append({'date': row.date.isoformat(), 'price': row.price})
+
+    # Sort by date and collapse duplicates per date/store by last value
+    for store, pts in series.items():
+        pts.sort(key=lambda x: x['date'])
+        collapsed = {}
+        for pt in pts:
+            collapsed[pt['date']] = pt['price']
+        series[store] = [{'date': d, 'price': p} for d, p in sorted(collapsed.items())]
+    return series
+
+
 @app.route('/price_history', methods=['POST'])
 @login_required
 def price_history():
+    from datetime import timedelta
+    from sqlalchemy.exc import IntegrityError
+
     api_token = os.environ.get('KASSAL_API_TOKEN')
     if not api_token:
         return jsonify({'error': 'API token not configured'}), 500
@@ -1780,73 +3991,36 @@ def price_history():
     if not isinstance(product_ids, list) or not product_ids:
         return jsonify({'series': {}})
 
-    headers = {
-        'Authorization': f'Bearer {api_token}',
-        'Accept': 'application/json'
+    ids = list(dict.fromkeys(str(pid) for pid in product_ids))
+    sync_rows = {
+        row.product_id: row
+        for row in PriceHistorySync.query.filter(PriceHistorySync.product_id.in_(ids)).all()
     }
 
-    series: Dict[str, list] = {}
-    for pid in product_ids:
-        try:
-            url = f'https://kassal.app/api/v1/products/{pid}'
-            print(f"[GET] {url}")
-            resp = requests.get(url, headers=headers)
-            if resp.status_code != 200:
+    # Only products not refreshed recently go upstream; the rest are served from the local store
+    refresh_cutoff = datetime.utcnow() - timedelta(seconds=PRICE_HISTORY_REFRESH_INTERVAL)
+    stale = [pid for pid in ids if pid not in sync_rows or sync_rows[pid].refreshed_at < refresh_cutoff]
+
+    failed = []
+    if stale:
+        results = kassal_engine.run(fetch_price_points_many(api_token, stale))
+        for pid, points in zip(stale, results):
+            if points is None:
+                # Fall back to stored history when there is any
+                if pid not in sync_rows:
+                    failed.append(pid)
                 continue
-            body = resp.json()
-            # Try common shapes to find price history
-            product = body.get('data') if isinstance(body, dict) else None
-            if not product:
-                product = body if isinstance(body, dict) else None
-
-            # Get store name from root when history items lack it
-            store_name_root = None
+            # One savepoint per product, so a conflict only skips that product
             try:
-                s = product.get('store') if isinstance(product, dict) else None
-                if isinstance(s, dict):
-                    store_name_root = s.get('name') or s.get('store')
-                elif isinstance(s, str):
-                    store_name_root = s
-            except Exception:
-                store_name_root = None
-
-            history_lists = []
-            if product:
-                if isinstance(product.get('prices'), list):
-                    history_lists.append(product['prices'])
-                if isinstance(product.get('price_history'), list):
-                    history_lists.append(product['price_history'])
-                if isinstance(product.get('priceHistory'), list):
-                    history_lists.append(product['priceHistory'])
-
-            for hist in history_lists:
-                for item in hist:
-                    price = item.get('price') or item.get('amount') or item.get('value')
-                    dt = item.get('date') or item.get('created_at') or item.get('updated_at') or item.get('timestamp')
-                    # Extract store name
-                    store_obj = item.get('store') if isinstance(item, dict) else None
-                    store_name = None
-                    if isinstance(store_obj, dict):
-                        store_name = store_obj.get('name') or store_obj.get('store')
-                    if not store_name:
-                        store_name = item.get('store') if isinstance(item, dict) else None
-                    if not store_name:
-                        store_name = store_name_root
-                    if store_name and price is not None and dt:
-                        series.setdefault(store_name, []).append({'date': str(dt)[:10], 'price': float(price)})
-        except Exception as e:
-            print(f"Error fetching price history for product {pid}: {e}")
-            continue
-
-    # Sort by date and collapse duplicates per date/store by last value
-    for store, pts in series.items():
-        pts.sort(key=lambda x: x['date'])
-        collapsed = {}
-        for pt in pts:
-            collapsed[pt['date']] = pt['price']
-        series[store] = [{'date': d, 'price': p} for d, p in sorted(collapsed.items())]
+                with db.session.begin_nested():
+                    store_price_points(pid, points, sync_rows.get(pid))
+            except IntegrityError:
+                # Another worker stored the same points concurrently; its rows are just as good
+                pass
+        db.session.commit()
 
-    return jsonify({'series': series})
+    # Partial results: series for every product that loaded, plus the ids that did not
+    return jsonify({'series': load_price_series(ids), 'failed': failed})
 
 
 # ============================
@@ -1877,9 +4051,8 @@ def create_product_cache_table():
 # Main
 # ============================
 if __name__ == '__main__':
-    static_path = os.path.join(os.path.dirname(__file__), 'static', 'categories.csv')
-    if not os.path.exists(static_path):
-        print(f"[WARN] Expected taxonomy at {static_path} (headers: id,parent_id,name)")
+    if not os.path.exists(CATEGORIES_CSV_PATH):
+        print(f"[WARN] Expected taxonomy at {CATEGORIES_CSV_PATH} (headers: id,parent_id,name)")
     # Allow overriding port via PORT env var; default to 5050 to avoid 5000 conflicts
     port = int(os.environ.get('PORT', '5050'))
     print(f"Starting server at http://127.0.0.1:{port} (debug=True)")
@@ -43,6 +43,13 @@ if (typeof Chart !== 'undefined' && typeof ChartDataLabels !== 'undefined') {
 // State management
 // Check if productsData was already set by the page (for shared comparisons)
 let productsData = window.productsData || null;
+// Comparison key from the URL; when set, the product grid is paged through /product_data/query
+let productKey = null;
+let serverPage = 1;
+let serverQuerySeq = 0;
+let serverQueryTimer = null;
+const deletedEans = new Set();
+const PRODUCT_PAGE_SIZE = 60;
 let userProduct = window.userProduct || null;
 let nutritionUnit = 'g'; // Default to grams, will be updated from API data
 let currentFilters = {
@@ -180,6 +187,25 @@ window.addEventListener('DOMContentLoaded', async () => {
                 renderMyProductBox(userProduct);
             }
         } else {
+            productKey = key;
+            let firstPage = null;
+            try {
+                firstPage = await fetchProductQuery(1, true);
+            } catch (err) {
+                console.warn('Product query API unavailable, loading the full product set:', err);
+                productKey = null;
+            }
+            if (firstPage) {
+                // Only the current page is held; matrix/export/share load the full set on demand
+                productsData = { ...firstPage.meta, products: null };
+                nutritionUnit = productsData.nutrition_unit || 'g';
+                userProduct = mode === 'explore' ? null : (productsData.user_product || null);
+                displayCategorySummary();
+                renderProductPage(firstPage);
+                renderMyProductBox(userProduct);
+            }
+        }
+        if (key && !productKey) {
             const resp = await fetch(`/get_product_data?key=${encodeURIComponent(key)}`);
             if (resp.ok) {
                 const data = await resp.json();
@@ -340,13 +366,16 @@ window.addEventListener('DOMContentLoaded', async () => {
             if (eansToDelete.length === 0) return;
             
             if (confirm(`Delete ${eansToDelete.length} selected product(s)?`)) {
-                // Remove products from productsData
-                if (productsData && productsData.products) {
-                    productsData.products = productsData.products.filter(p => !eansToDelete.includes(p.ean));
+                // Remove products from productsData (and from server-side queries)
+                if (productsData && (productsData.products || productKey)) {
+                    eansToDelete.forEach(ean => deletedEans.add(ean));
+                    if (productsData.products) {
+                        productsData.products = productsData.products.filter(p => !eansToDelete.includes(p.ean));
+                    }
                     showToast(`${eansToDelete.length} product(s) removed`, 'success');
                     // Hide delete button
                     deleteSelectedBtn.style.display = 'none';
-                    renderProducts();
+                    renderProducts(serverPage);
                 }
             }
         });
@@ -409,7 +438,7 @@ function displayCategorySummary() {
 
 // Sort and filter products
 function getFilteredAndSortedProducts() {
-    if (!productsData) return [];
+    if (!productsData || !productsData.products) return [];
 
     let products = [...productsData.products];
 
@@ -600,8 +629,105 @@ function isValidHttpUrl(u) {
     }
 }
 
+// Fetch one page of grouped, filtered and sorted products from the server
+async function fetchProductQuery(page, includeMeta = false) {
+    const resp = await fetch('/product_data/query', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({
+            key: productKey,
+            search: currentFilters.search,
+            sort_by: currentFilters.sortBy,
+            updated_within_months: currentFilters.updatedWithinMonths,
+            hide_no_nutrition: currentFilters.hideNoNutrition,
+            exclude_eans: Array.from(deletedEans),
+            page: page,
+            page_size: PRODUCT_PAGE_SIZE,
+            include_meta: includeMeta
+        })
+    });
+    if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+    return resp.json();
+}
+
+// Load and render a page of products (debounced; responses to older queries are dropped)
+function renderServerProducts(page = 1) {
+    clearTimeout(serverQueryTimer);
+    serverQueryTimer = setTimeout(async () => {
+        const seq = ++serverQuerySeq;
+        let result;
+        try {
+            result = await fetchProductQuery(page);
+        } catch (err) {
+            console.error('Failed to query products:', err);
+            showToast('Failed to load products', 'error');
+            return;
+        }
+        if (seq !== serverQuerySeq) return;
+        renderProductPage(result);
+    }, 150);
+}
+
+function renderProductPage(result) {
+    serverPage = result.page;
+    const groups = (result.groups || []).map(g => ({ ...g, minPrice: g.min_price, minUnitPrice: g.min_unit_price }));
+    renderCategorySummary(result.summary);
+    renderProductGrid(groups);
+    renderProductPager(result);
+}
+
+function renderProductPager(result) {
+    const grid = document.getElementById('product-grid');
+    let pager = document.getElementById('product-pager');
+    if (!pager && grid) {
+        pager = document.createElement('div');
+        pager.id = 'product-pager';
+        pager.className = 'product-pager';
+        grid.after(pager);
+    }
+    if (!pager) return;
+    if (result.pages <= 1) {
+        pager.innerHTML = '';
+        pager.style.display = 'none';
+        return;
+    }
+    pager.style.display = 'flex';
+    pager.innerHTML = `
+        <button type="button" class="btn-secondary" data-page="${result.page - 1}" ${result.page <= 1 ? 'disabled' : ''}>‹ Previous</button>
+        <span>Page ${result.page} of ${result.pages} (${result.total_groups} products)</span>
+        <button type="button" class="btn-secondary" data-page="${result.page + 1}" ${result.page >= result.pages ? 'disabled' : ''}>Next ›</button>
+    `;
+    pager.querySelectorAll('button[data-page]').forEach(button => {
+        button.addEventListener('click', () => {
+            renderProducts(parseInt(button.dataset.page, 10));
+            grid.scrollIntoView({ behavior: 'smooth' });
+        });
+    });
+}
+
+// Views that need every product (matrix, CSV export, sharing) load the full set once
+async function ensureFullProductData() {
+    if (!productsData) return false;
+    if (productsData.products) return true;
+    const resp = await fetch(`/get_product_data?key=${encodeURIComponent(productKey)}`);
+    if (!resp.ok) {
+        console.error('Failed to fetch product data:', resp.status);
+        return false;
+    }
+    const data = await resp.json();
+    productsData.products = (data.products || []).filter(p => !deletedEans.has(p.ean));
+    return true;
+}
+
 // Render product cards
-function renderProducts() {
+function renderProducts(page = 1) {
+    if (productKey) {
+        renderServerProducts(page);
+        return;
+    }
+
     const products = getFilteredAndSortedProducts();
     
     // Group by EAN and sort according to current filter
@@ -645,8 +771,11 @@ function renderProducts() {
     });
     
     // Update the category summary panel with current groups
-    renderCategorySummary(groups);
-    
+    renderCategorySummary(summarizeGroups(groups));
+    renderProductGrid(groups);
+}
+
+function renderProductGrid(groups) {
     const grid = document.getElementById('product-grid');
     grid.innerHTML = groups.map(group => `
         <div class="product-card" data-ean="${group.ean || ''}">
@@ -733,17 +862,8 @@ function renderProducts() {
 
 }
 
-// Compute and render summary over current (visible) product groups
-function renderCategorySummary(groups) {
-    const container = document.getElementById('category-summary');
-    const section = document.getElementById('category-summary-section');
-    if (!container || !section) return;
-    if (!groups || groups.length === 0) {
-        section.style.display = 'none';
-        container.innerHTML = '';
-        return;
-    }
-
+// Compute the summary figures over product groups (same shape as /product_data/query's summary)
+function summarizeGroups(groups) {
     // Average min price and unit price across groups where finite
     const priceVals = groups.map(g => g.minPrice).filter(isFiniteNumber);
     const unitVals = groups.map(g => g.minUnitPrice).filter(isFiniteNumber);
@@ -781,20 +901,31 @@ function renderCategorySummary(groups) {
     console.log(`=== Summary Calculation ===`);
     console.log(`Total unique products (by EAN): ${groups.length}`);
     if (avgNut.length > 0) {
-        const productsWithNutrition = groups.filter(g => {
-            const nut = g.nutrition || {};
-            return Object.keys(nut).length > 0;
-        }).length;
-        console.log(`Products with nutrition data: ${productsWithNutrition}`);
         console.log(`Products used for each nutrient:`, avgNut.reduce((acc, n) => {
             acc[n.code] = n.count;
             return acc;
         }, {}));
     }
-    console.log(`This should match the number of product cards you see on the page: ${groups.length}`);
 
+    return { count: groups.length, avg_price: avgPrice, avg_unit_price: avgUnit, nutrition: avgNut };
+}
+
+// Render the summary panel for the current (visible) product groups
+function renderCategorySummary(summary) {
+    const container = document.getElementById('category-summary');
+    const section = document.getElementById('category-summary-section');
+    if (!container || !section) return;
+    if (!summary || !summary.count) {
+        section.style.display = 'none';
+        container.innerHTML = '';
+        return;
+    }
+
+    const avgPrice = summary.avg_price;
+    const avgUnit = summary.avg_unit_price;
+    const avgNut = summary.nutrition || [];
 
-    const header = `<div class="summary-title">Summary for ${groups.length} product${groups.length!==1?'s':''} <span style="font-size: 0.85em; color: #888; font-weight: normal;">(same as displayed below)</span></div>`;
+    const header = `<div class="summary-title">Summary for ${summary.count} product${summary.count!==1?'s':''} <span style="font-size: 0.85em; color: #888; font-weight: normal;">(all matching products, across all pages)</span></div>`;
     const stats = `
         <div class="summary-grid">
             <div class="summary-item">
@@ -1162,9 +1293,10 @@ function allergenPresenceLabel(v) {
 }
 
 // Build and render the nutrition matrix
-function renderMatrix() {
+async function renderMatrix() {
     const container = document.getElementById('matrix-container');
     if (!container || !productsData) return;
+    if (!(await ensureFullProductData())) return;
     if (!userProduct || !userProduct.nutrition) {
         container.innerHTML = '<div style="padding:0.5em;color:#666;">Provide a reference product with nutrition to enable the matrix.</div>';
         return;
@@ -1659,8 +1791,8 @@ function renderMyProductSummaryChart(entries) {
 }
 
 // Export nutrition matrix to CSV
-function exportMatrixToCSV() {
-    if (!productsData || !userProduct || !userProduct.nutrition) {
+async function exportMatrixToCSV() {
+    if (!productsData || !userProduct || !userProduct.nutrition || !(await ensureFullProductData())) {
         alert('No matrix data available to export.');
         return;
     }
@@ -1865,6 +1997,7 @@ document.addEventListener('DOMContentLoaded', () => {
     if (shareBtn) {
         shareBtn.addEventListener('click', async () => {
             // Validate we have data to share
+            await ensureFullProductData();
             if (!productsData || !productsData.products || productsData.products.length === 0) {
                 showToast('No comparison data available to share.', 'warning');
                 return;
@@ -252,6 +252,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
 let selectedCategories = [];
 let categoryTree = [];
+const CATEGORY_SEARCH_LIMIT = 200; // server caps category_search at 200 results
 
 // Load category tree and initialize selectors
 async function loadCategoryTree() {
@@ -301,13 +302,48 @@ function renderCategorySelectors(path = []) {
     
     container.appendChild(treeView);
 
-    // Hook up search filtering
+    // Hook up search filtering (server-side index, debounced; stale replies are dropped)
+    let searchTimer = null;
+    let searchSeq = 0;
     searchInput.addEventListener('input', () => {
-        const q = searchInput.value.trim().toLowerCase();
-        const filtered = q ? filterCategoryTree(categoryTree, q) : categoryTree;
-        treeContainer.innerHTML = '';
-        // Force expanded view when searching so matches are visible
-        renderCategoryTree(filtered, treeContainer, [], Boolean(q));
+        clearTimeout(searchTimer);
+        const q = searchInput.value.trim();
+        if (!q) {
+            searchSeq++;
+            treeContainer.innerHTML = '';
+            renderCategoryTree(categoryTree, treeContainer, [], false);
+            return;
+        }
+        searchTimer = setTimeout(async () => {
+            const seq = ++searchSeq;
+            let filtered;
+            let truncatedNote = null;
+            try {
+                const res = await fetch(`/category_search?q=${encodeURIComponent(q)}&limit=${CATEGORY_SEARCH_LIMIT}`);
+                if (!res.ok) throw new Error(`HTTP ${res.status}`);
+                const data = await res.json();
+                const results = data.results || [];
+                const keep = new Set();
+                results.forEach(r => (r.path_ids || []).forEach(id => keep.add(String(id))));
+                filtered = filterCategoryTree(categoryTree, keep);
+                if (data.total > results.length) {
+                    truncatedNote = `Showing the ${results.length} best of ${data.total} matching categories. Type more to narrow the search.`;
+                }
+            } catch (err) {
+                console.error('Category search failed:', err);
+                filtered = filterCategoryTreeByName(categoryTree, q.toLowerCase());
+            }
+            if (seq !== searchSeq) return;
+            treeContainer.innerHTML = '';
+            if (truncatedNote) {
+                const note = document.createElement('div');
+                note.className = 'tree-search-note';
+                note.textContent = truncatedNote;
+                treeContainer.appendChild(note);
+            }
+            // Force expanded view when searching so matches are visible
+            renderCategoryTree(filtered, treeContainer, [], true);
+        }, 150);
     });
 }
 
@@ -392,7 +428,18 @@ function renderCategoryTree(categories, container, parentPath, forceExpanded = f
 }
 
 // Filter the category tree by query, keeping parents of matches. Returns a new pruned tree.
-function filterCategoryTree(tree, query) {
+// Keep only the nodes whose ids are in `ids` (search matches plus their ancestors)
+function filterCategoryTree(tree, ids) {
+    const matchNode = (node) => {
+        if (!ids.has(String(node.id))) return null;
+        const children = (node.children || []).map(matchNode).filter(Boolean);
+        return { id: node.id, name: node.name, children };
+    };
+    return (tree || []).map(matchNode).filter(Boolean);
+}
+
+// Local fallback when the search endpoint is unavailable
+function filterCategoryTreeByName(tree, query) {
     const matchNode = (node) => {
         const name = String(node.name || '').toLowerCase();
         let matched = name.includes(query);
@@ -763,7 +810,9 @@ document.getElementById('find-products').onclick = async function() {
                 selected_categories: selectedCategories, 
                 user_product: userProduct,
                 mode: currentMode,
-                nutrition_unit: nutritionUnit 
+                nutrition_unit: nutritionUnit,
+                // Keep the product matrix on the server; only the cache key comes back
+                persist: true
             })
         });
 
@@ -779,18 +828,8 @@ document.getElementById('find-products').onclick = async function() {
             throw new Error('Failed to fetch products');
         }
 
-        const data = await response.json();
-
-        // Store product data in server-side cache and redirect with a tiny key
-        const storeResp = await fetch('/set_product_data', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(data)
-        });
-        if (!storeResp.ok) {
-            throw new Error('Failed to store product data');
-        }
-        const storeJson = await storeResp.json();
+        // Product data is already stored server-side; redirect with the tiny key
+        const storeJson = await response.json();
         const key = storeJson && storeJson.key;
         if (key) {
             // Check if we're in editing mode
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Create the categories table and import app/static/categories.csv into it.
+
+Usage:
+    python import_categories.py            # add new categories, update names/parents, keep is_active
+    python import_categories.py --replace  # rewrite the table from the CSV (including is_active)
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.app import app, db, Category, import_categories_from_csv
+
+if __name__ == '__main__':
+    with app.app_context():
+        Category.__table__.create(db.engine, checkfirst=True)
+        count = import_categories_from_csv(replace='--replace' in sys.argv[1:])
+        print(f"✓ Imported {count} categories into the categories table")
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Background warm-up worker for the product listing cache.
+
+Periodically refreshes Kassal listings for the most requested leaf categories
+(saved searches + recent find_products calls) into the shared
+product_listing_cache table, so interactive requests hit a warm cache.
+It draws from the same rate limit budget as the web workers but leaves
+WARMUP_RATE_RESERVE tokens for interactive traffic.
+
+Usage:
+    python warmup.py          # run forever, every WARMUP_INTERVAL seconds
+    python warmup.py --once   # single pass (e.g. from a cron job)
+"""
+import sys
+import time
+
+from app.app import app, db, kassal_engine, ProductListingCache, CategoryDemand, run_category_warmup, \
+    WARMUP_INTERVAL, WARMUP_RATE_RESERVE
+
+if __name__ == '__main__':
+    # The warm-up process only helps the web workers through the shared DB tier
+    kassal_engine.cache.persist = True
+    kassal_engine.rate_reserve = WARMUP_RATE_RESERVE
+
+    with app.app_context():
+        ProductListingCache.__table__.create(db.engine, checkfirst=True)
+        CategoryDemand.__table__.create(db.engine, checkfirst=True)
+
+    once = '--once' in sys.argv[1:]
+    print(f"Starting category warm-up worker (interval {WARMUP_INTERVAL}s)")
+    sys.stdout.flush()
+
+    while True:
+        run_category_warmup()
+        sys.stdout.flush()
+        if once:
+            break
+        time.sleep(WARMUP_INTERVAL)